@@ -0,0 +1,97 @@
+"""
+Backfilling generated days: one hourly DAG run after another (shards, merge, one publish
+per run) against `src.backfill` loading the whole range into one database and publishing once.
+Both publish to `FakeBigQueryClient`; throughput is delay rows per second end to end.
+
+    python -m benchmarks.backfill --scale small --days 2
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+
+from benchmarks.common import build_shards, load_time_dim, measure
+from benchmarks.generators import SCALES, write_dataset
+
+START = datetime.date(2024, 12, 25)
+
+
+def hourly_runs(root: str, days: int) -> dict:
+    import duckdb
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src.bigquery import publish_tables_to_bigquery
+    from src.enums import Table
+    from src.shards import DUCKDB_SHARDS, merge_shard_databases
+
+    os.chdir(root)
+    bigquery_client = FakeBigQueryClient()
+    delays = 0
+    for d in range(days):
+        day = START + datetime.timedelta(days=d)
+        for hour in range(24):
+            run_dir = os.path.join(root, "runs", f"{day}-{hour:02d}")
+            shard_paths = build_shards(run_dir, day, hour)
+            with duckdb.connect(os.path.join(run_dir, "run.duckdb")) as dbsession:
+                merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS)
+                load_time_dim(dbsession, day, hour)
+                delays += dbsession.execute("select count(*) from delays").fetchone()[0]
+                publish_tables_to_bigquery(
+                    bigquery_client, dbsession, list(Table), "project", "dataset"
+                )
+    return {
+        "delays": delays,
+        "loads": len(bigquery_client.loads),
+        "queries": len(bigquery_client.queries),
+    }
+
+
+def backfill(root: str, days: int) -> dict:
+    import duckdb
+    import pendulum
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src.backfill import backfill_into_duckdb
+    from src.bigquery import publish_tables_to_bigquery
+    from src.enums import Table
+
+    os.chdir(root)
+    bigquery_client = FakeBigQueryClient()
+    start = pendulum.date(START.year, START.month, START.day)
+    with duckdb.connect(os.path.join(root, "backfill.duckdb")) as dbsession:
+        delays = backfill_into_duckdb(start, start.add(days=days - 1), dbsession)
+        publish_tables_to_bigquery(
+            bigquery_client, dbsession, list(Table), "project", "dataset"
+        )
+    return {
+        "delays": delays,
+        "loads": len(bigquery_client.loads),
+        "queries": len(bigquery_client.queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--days", type=int, default=2)
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    with tempfile.TemporaryDirectory() as tmp:
+        for d in range(args.days):
+            write_dataset(tmp, START + datetime.timedelta(days=d), scale, seed=d)
+        expected = scale.delays_per_hour * 24 * args.days
+        print(f"scale {args.scale}: {args.days} days, {expected:,} delays")
+
+        for name, fn in [("hourly runs", hourly_runs), ("backfill", backfill)]:
+            m = measure(name, fn, tmp, args.days)
+            assert m.result["delays"] == expected, f"{name} loaded {m.result}"
+            print(
+                f"{m} {expected / m.wall_s:>10,.0f} rows/s"
+                f" {m.result['loads']:>6} loads {m.result['queries']:>5} MERGE scripts"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Peak memory and wall time of publishing DelayFact: the old pandas path
+(`.df()`, `drop_duplicates`, `load_table_from_dataframe`) against the Parquet export in `src.bigquery`.
+Both upload to `FakeBigQueryClient`, so nothing leaves the machine.
+
+    python -m benchmarks.bigquery_upload --scale city
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+
+from benchmarks.common import build_shards, load_time_dim, measure
+from benchmarks.generators import SCALES, write_dataset
+
+DAY = datetime.date(2024, 12, 25)
+# check_resume fails the publish after 2 chunk loads out of about this many
+RESUME_CHUNKS = 6
+
+
+def pandas_path(run_path: str) -> int:
+    import duckdb
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src.enums import Table
+
+    table = Table.DELAY
+    with duckdb.connect(run_path, read_only=True) as dbsession:
+        df = dbsession.execute(table.duckdb_query).df()
+    df = df.loc[:, ~df.columns.duplicated()]
+    df = df.drop_duplicates(subset=table.unique_key_columns)
+    FakeBigQueryClient().load_table_from_dataframe(df, "staging")
+    return len(df)
+
+
+def parquet_path(run_path: str) -> int:
+    import duckdb
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src.bigquery import publish_table_to_bigquery
+    from src.enums import Table
+
+    with duckdb.connect(run_path, read_only=True) as dbsession:
+        return publish_table_to_bigquery(
+            FakeBigQueryClient(), dbsession, Table.DELAY, "project", "dataset"
+        )
+
+
+def check_resume(run_path: str, work_dir: str):
+    """
+    Fail the publish halfway through the staging loads, then retry and check only missing chunks load.
+    """
+    import duckdb
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src import bigquery as publish
+    from src.enums import Table
+
+    with duckdb.connect(run_path, read_only=True) as dbsession:
+        rows = dbsession.execute(
+            f"select count(*) from ({publish.deduplicated_query(dbsession, Table.DELAY)})"
+        ).fetchone()[0]
+        assert rows >= RESUME_CHUNKS, f"{rows} rows can't fill {RESUME_CHUNKS} chunks"
+        # a chunk per row group, so the export splits into about RESUME_CHUNKS at any scale
+        publish.EXPORT_ROW_GROUP_SIZE = -(-rows // RESUME_CHUNKS)
+        publish.BIGQUERY_CHUNK_SIZE = "1KB"
+        publish.BIGQUERY_LOAD_CONCURRENCY = 1
+
+        failing = FakeBigQueryClient(fail_after_loads=2)
+        try:
+            publish.publish_table_to_bigquery(
+                failing, dbsession, Table.DELAY, "project", "dataset", work_dir
+            )
+            raise AssertionError("first attempt was supposed to fail")
+        except RuntimeError:
+            pass
+
+        retry = FakeBigQueryClient()
+        rows = publish.publish_table_to_bigquery(
+            retry, dbsession, Table.DELAY, "project", "dataset", work_dir
+        )
+
+    chunks = len(retry.queries[0].split("UNION ALL"))
+    assert len(retry.loads) == chunks - 2, (len(retry.loads), chunks)
+    print(
+        f"resume ok: {rows:,} rows in {chunks} chunks, retry loaded {len(retry.loads)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    args = parser.parse_args()
+
+    import duckdb
+
+    from src.shards import DUCKDB_SHARDS, merge_shard_databases
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        shard_paths = build_shards(os.path.join(tmp, "shards"), DAY, hour=None)
+        run_path = os.path.join(tmp, "run.duckdb")
+        with duckdb.connect(run_path) as dbsession:
+            merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS, mode="copy")
+            load_time_dim(dbsession, DAY, hour=None)
+
+        results = [
+            measure("pandas + load_table_from_dataframe", pandas_path, run_path),
+            measure("duckdb copy + load_table_from_file", parquet_path, run_path),
+        ]
+        assert results[0].result == results[1].result, [m.result for m in results]
+        print(f"DelayFact: {results[0].result:,} rows")
+        for m in results:
+            print(m)
+
+        check_resume(run_path, os.path.join(tmp, "publish"))
+
+
+if __name__ == "__main__":
+    main()
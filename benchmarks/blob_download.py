@@ -0,0 +1,103 @@
+"""
+Reading a csv blob: the old `readall().decode()` into `StringIO` against the streamed
+`get_csv_as_df`, then syncing a whole generated day from fake containers and loading it.
+Runs against `FakeContainerClient`, a local directory standing in for a container.
+
+    python -m benchmarks.blob_download --rows 2000000
+"""
+
+import argparse
+import datetime
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+from benchmarks.common import measure
+from benchmarks.fakes import FakeContainerClient
+from benchmarks.generators import SCALES, write_dataset, write_delays
+
+DAY = datetime.date(2024, 12, 25)
+
+
+def readall_path(root: str) -> int:
+    container_client = FakeContainerClient(root)
+    with container_client.get_blob_client("delays.csv") as blob_client:
+        data = blob_client.download_blob().readall()
+        return len(pd.read_csv(io.StringIO(data.decode())))
+
+
+def streamed_path(root: str) -> int:
+    from src.blob_storage import get_csv_as_df
+
+    return len(get_csv_as_df(FakeContainerClient(root), "delays.csv"))
+
+
+def sync_day(buckets_root: str, work_dir: str) -> int:
+    import duckdb
+    import pendulum
+
+    from src.blob_storage import sync_blobs_to_local
+    from src.delays import (
+        DELAYS_LOCAL_DIR,
+        delays_blob_prefix,
+        load_delays_into_duckdb,
+    )
+    from src.gtfs import GTFS_LOCAL_DIR, gtfs_blob_prefix, load_gtfs_into_duckdb
+    from src.weather import (
+        WEATHER_LOCAL_DIR,
+        load_weather_into_duckdb,
+        weather_blob_prefix,
+    )
+
+    os.chdir(work_dir)
+    as_of = pendulum.date(DAY.year, DAY.month, DAY.day)
+    for local_dir, prefix in [
+        (GTFS_LOCAL_DIR, gtfs_blob_prefix(as_of)),
+        (DELAYS_LOCAL_DIR, delays_blob_prefix(as_of)),
+        (WEATHER_LOCAL_DIR, weather_blob_prefix(as_of)),
+    ]:
+        container_client = FakeContainerClient(os.path.join(buckets_root, local_dir))
+        sync_blobs_to_local(container_client, prefix, local_dir)
+
+    with duckdb.connect() as dbsession:
+        load_gtfs_into_duckdb(as_of, dbsession)
+        load_delays_into_duckdb(as_of, dbsession)
+        load_weather_into_duckdb(as_of, dbsession)
+        return dbsession.execute("select count(*) from delays").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_delays(os.path.join(tmp, "delays.csv"), args.rows)
+        size_mb = os.path.getsize(os.path.join(tmp, "delays.csv")) / 2**20
+        print(f"delays.csv blob: {args.rows:,} rows, {size_mb:.1f} MB")
+        for name, fn in [
+            ("readall + decode + StringIO", readall_path),
+            ("streamed get_csv_as_df", streamed_path),
+        ]:
+            m = measure(name, fn, tmp)
+            assert m.result == args.rows, f"{name} read {m.result} rows"
+            print(m)
+
+    with (
+        tempfile.TemporaryDirectory() as buckets,
+        tempfile.TemporaryDirectory() as work,
+    ):
+        scale = SCALES[args.scale]
+        # the generator lays out data/ like the buckets are mirrored into it
+        write_dataset(buckets, DAY, scale)
+        for attempt in ["cold sync + load", "warm sync + load"]:
+            m = measure(attempt, sync_day, buckets, work)
+            assert m.result == scale.delays_per_hour * 24, f"loaded {m.result} delays"
+            print(m)
+
+
+if __name__ == "__main__":
+    main()
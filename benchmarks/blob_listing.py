@@ -0,0 +1,94 @@
+"""
+Finding the YYYY/MM/DD prefixes of a container holding years of hourly traffic blobs:
+the old flat `list_blobs` scan against the hierarchical walk, with and without the
+persisted prefix index. Reports wall time and the number of items the service returned.
+
+    python -m benchmarks.blob_listing --blobs 1000000
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from typing import Iterator, List, Set
+
+from benchmarks.fakes import FakeBlobListing
+from src.blob_storage import date_prefixes_for_container
+
+START = datetime.date(2015, 1, 1)
+
+
+def traffic_blob_names(count: int, files_per_hour: int = 12) -> List[str]:
+    names = []
+    day = START
+    while len(names) < count:
+        for hour in range(24):
+            for n in range(files_per_hour):
+                names.append(f"{day.strftime('%Y/%m/%d')}/{hour:02d}-{n:02d}.csv")
+        day += datetime.timedelta(days=1)
+    return names[:count]
+
+
+def flat_scan(container_client) -> Iterator[str]:
+    # what date_prefixes_for_container used to do
+    prefixes: Set[str] = set()
+    for blob in container_client.list_blobs():
+        parts = blob.name.split("/")
+        if (
+            len(parts) >= 3
+            and parts[0].isdigit()
+            and parts[1].isdigit()
+            and parts[2].isdigit()
+        ):
+            prefixes.add(f"{parts[0]}/{parts[1].zfill(2)}/{parts[2].zfill(2)}")
+    return iter(sorted(prefixes))
+
+
+def run(name: str, container_client: FakeBlobListing, fn, *args) -> List[str]:
+    calls, items = container_client.calls, container_client.items_listed
+    start = time.perf_counter()
+    prefixes = list(fn(container_client, *args))
+    print(
+        f"{name:<32} {time.perf_counter() - start:>9.3f}s"
+        f" {container_client.calls - calls:>6} calls"
+        f" {container_client.items_listed - items:>10,} items listed"
+        f" {len(prefixes):>7,} days"
+    )
+    return prefixes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blobs", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    container_client = FakeBlobListing(traffic_blob_names(args.blobs))
+    print(f"{len(container_client.names):,} blob names")
+
+    expected = run("flat list_blobs", container_client, flat_scan)
+    assert run("walk_blobs", container_client, date_prefixes_for_container) == expected
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "traffic-prefixes.json")
+        for name in ["walk + index, cold", "walk + index, warm"]:
+            prefixes = run(
+                name, container_client, date_prefixes_for_container, index_path
+            )
+            assert prefixes == expected
+
+        # the scraper drops the next hour of a new day
+        next_day = datetime.datetime.strptime(expected[-1], "%Y/%m/%d").date()
+        next_day += datetime.timedelta(days=1)
+        container_client.add(f"{next_day.strftime('%Y/%m/%d')}/00-00.csv")
+        prefixes = run(
+            "walk + index, new day",
+            container_client,
+            date_prefixes_for_container,
+            index_path,
+        )
+        assert prefixes == expected + [next_day.strftime("%Y/%m/%d")]
+
+
+if __name__ == "__main__":
+    main()
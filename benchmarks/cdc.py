@@ -0,0 +1,111 @@
+"""
+Publishing a day of hourly runs with and without key digests. Every run republishes the
+day's dimensions and its hour of delays, or with `--cumulative` every delay of the day so far;
+with digests only rows no earlier run published are uploaded. Checks that digest mode ends up uploading every distinct key exactly once.
+
+    python -m benchmarks.cdc --scale small --cumulative
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import duckdb
+
+from benchmarks.common import build_shards, load_time_dim
+from benchmarks.fakes import FakeBigQueryClient
+from benchmarks.generators import SCALES, write_dataset
+from src.bigquery import deduplicated_query, publish_tables_to_bigquery
+from src.digests import key_digest_sql
+from src.enums import Table
+from src.shards import DUCKDB_SHARDS, merge_shard_databases
+
+DAY = datetime.date(2024, 12, 25)
+
+
+def prepare_hour(day_path: str, run_path: str, hour: int, cumulative: bool):
+    shutil.copy(day_path, run_path)
+    with duckdb.connect(run_path) as dbsession:
+        dbsession.execute(
+            f'delete from delays where hour("Timestamp") {">" if cumulative else "!="} ?',
+            [hour],
+        )
+        load_time_dim(dbsession, DAY, None if cumulative else hour)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--cumulative", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        shard_paths = build_shards(os.path.join(tmp, "shards"), DAY, hour=None)
+        day_path = os.path.join(tmp, "day.duckdb")
+        with duckdb.connect(day_path) as dbsession:
+            merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS, mode="copy")
+
+        run_path = os.path.join(tmp, "run.duckdb")
+        digest_dir = os.path.join(tmp, "digests")
+        clients = {"full": FakeBigQueryClient(), "digest": FakeBigQueryClient()}
+        rows = {mode: 0 for mode in clients}
+        seconds = {mode: 0.0 for mode in clients}
+        distinct_path = os.path.join(tmp, "distinct.duckdb")
+        with duckdb.connect(distinct_path) as dbsession:
+            for table in Table:
+                dbsession.execute(f"create table {table.name} (digest ubigint)")
+
+        for hour in range(args.hours):
+            prepare_hour(day_path, run_path, hour, args.cumulative)
+            with duckdb.connect(run_path, read_only=True) as dbsession:
+                for mode, client in clients.items():
+                    start = time.perf_counter()
+                    published = publish_tables_to_bigquery(
+                        client,
+                        dbsession,
+                        list(Table),
+                        "project",
+                        "dataset",
+                        digest_dir=digest_dir if mode == "digest" else None,
+                    )
+                    seconds[mode] += time.perf_counter() - start
+                    rows[mode] += sum(published.values())
+
+                # every key a full upload staged, to count the distinct ones at the end
+                dbsession.execute(f"attach '{distinct_path}' as seen (read_only false)")
+                for table in Table:
+                    query = deduplicated_query(dbsession, table)
+                    key_digest = key_digest_sql(table.unique_key_columns, "q")
+                    dbsession.execute(
+                        f"insert into seen.{table.name} select {key_digest} from ({query}) q"
+                    )
+                dbsession.execute("detach seen")
+
+        with duckdb.connect(distinct_path, read_only=True) as dbsession:
+            expected = sum(
+                dbsession.execute(
+                    f"select count(distinct digest) from {t.name}"
+                ).fetchone()[0]
+                for t in Table
+            )
+        assert rows["digest"] == expected, (rows["digest"], expected)
+        print(
+            f"scale {args.scale}, {args.hours} {'cumulative' if args.cumulative else 'hourly'} runs, "
+            f"{expected:,} distinct keys"
+        )
+        for mode, client in clients.items():
+            uploaded_mb = sum(load["bytes"] for load in client.loads) / 2**20
+            print(
+                f"{mode:<8} {seconds[mode]:>8.2f}s {rows[mode]:>12,} rows staged "
+                f"{uploaded_mb:>9.2f} MB uploaded {len(client.loads):>5} load jobs"
+            )
+
+
+if __name__ == "__main__":
+    main()
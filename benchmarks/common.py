@@ -0,0 +1,86 @@
+import dataclasses
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclasses.dataclass
+class Measurement:
+    name: str
+    wall_s: float
+    peak_rss_mb: float
+    result: Any = None
+
+    def __str__(self) -> str:
+        return f"{self.name:<32} {self.wall_s:>9.3f}s {self.peak_rss_mb:>10.1f} MB"
+
+
+def _timed(fn: Callable, args: tuple) -> tuple:
+    from src.instrumentation import peak_rss_mb, reset_peak_rss
+
+    # ru_maxrss survives the fork and exec of the spawn, so the parent's peak would leak in
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start, peak_rss_mb()
+
+
+def measure(name: str, fn: Callable, *args) -> Measurement:
+    """
+    Run `fn(*args)` in a fresh process and report the peak RSS of the call alone,
+    counted from a reset high-water mark (linux only, elsewhere the process lifetime peak).
+    `fn` has to be a module level function to be picklable.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        result, wall_s, peak_rss_mb = pool.submit(_timed, fn, args).result()
+    return Measurement(name, wall_s, peak_rss_mb, result)
+
+
+def build_shards(
+    shard_dir: str, day: datetime.date, hour: Optional[int]
+) -> Dict[str, str]:
+    """
+    Run every loader into its own shard database, like the DAG's load tasks do.
+    Without `hour` the whole day is loaded, as if a run covered all of it.
+    Expects the working directory to hold a generated `data/` tree.
+    """
+    import duckdb
+    import pendulum
+
+    from src.delays import load_delays_into_duckdb
+    from src.gtfs import load_gtfs_into_duckdb
+    from src.shards import DUCKDB_SHARDS
+    from src.vehicles import load_vehicles_into_duckdb
+    from src.weather import load_weather_into_duckdb
+
+    as_of = pendulum.date(day.year, day.month, day.day)
+    loaders = {
+        "gtfs": lambda s: load_gtfs_into_duckdb(as_of, s),
+        "delays": lambda s: load_delays_into_duckdb(as_of, s, hour=hour),
+        "vehicles": lambda s: load_vehicles_into_duckdb(s),
+        "weather": lambda s: load_weather_into_duckdb(as_of, s),
+    }
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_paths = {}
+    for shard in DUCKDB_SHARDS:
+        shard_paths[shard] = os.path.join(shard_dir, f"{shard}.duckdb")
+        with duckdb.connect(shard_paths[shard]) as dbsession:
+            loaders[shard](dbsession)
+    return shard_paths
+
+
+def load_time_dim(dbsession, day: datetime.date, hour: Optional[int]):
+    """
+    Fill `time_dim` of a merged run database with the hours `build_shards` loaded.
+    """
+    import pendulum
+
+    from src.time_utils import load_time_dim_into_duckdb
+
+    first_hour = pendulum.datetime(day.year, day.month, day.day, hour or 0)
+    last_hour = first_hour.add(hours=0 if hour is not None else 23)
+    load_time_dim_into_duckdb(first_hour, last_hour, dbsession)
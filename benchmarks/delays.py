@@ -0,0 +1,91 @@
+"""
+Delay normalisation: per-row pandas `.apply` against the columnar DuckDB SQL in `src.delays`.
+Checks parity on a sample first, then times both paths on the whole file.
+
+    python -m benchmarks.delays --rows 10000000
+"""
+
+import argparse
+import os
+import tempfile
+
+import pandas as pd
+
+from benchmarks.common import measure
+from benchmarks.generators import write_delays
+
+
+def apply_path(csv_path: str) -> int:
+    from src.delays import _normalize_delay, _normalize_timestamp
+
+    df = pd.read_csv(csv_path)
+    df["Delay"] = df["Delay"].apply(_normalize_delay)
+    df["Timestamp"] = df["Timestamp"].apply(_normalize_timestamp)
+    return len(df)
+
+
+def sql_path(csv_path: str) -> int:
+    import duckdb
+
+    from src.delays import _normalized_delays_sql
+    from src.ingestion import configure_session
+
+    with duckdb.connect() as dbsession:
+        configure_session(dbsession)
+        dbsession.execute(
+            f"create table delays as {_normalized_delays_sql([csv_path])}"
+        )
+        return dbsession.execute("select count(*) from delays").fetchone()[0]
+
+
+def check_parity(csv_path: str, sample: int):
+    import duckdb
+
+    from src.delays import (
+        _normalize_delay,
+        _normalize_timestamp,
+        _normalized_delays_sql,
+    )
+
+    expected = pd.read_csv(csv_path, nrows=sample, dtype=str)
+    expected["Delay"] = expected["Delay"].apply(_normalize_delay)
+    expected["Timestamp"] = expected["Timestamp"].apply(_normalize_timestamp)
+
+    with duckdb.connect() as dbsession:
+        actual = dbsession.execute(
+            f"select * from ({_normalized_delays_sql([csv_path])}) limit {sample}"
+        ).df()
+
+    pd.testing.assert_series_equal(
+        expected["Delay"], actual["Delay"], check_dtype=False
+    )
+    assert (
+        expected["Timestamp"].map(pd.Timestamp.timestamp)
+        == actual["Timestamp"].map(pd.Timestamp.timestamp)
+    ).all(), "hour flooring differs"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--parity-sample", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "delays.csv")
+        write_delays(csv_path, args.rows)
+        print(
+            f"delays.csv: {args.rows:,} rows, {os.path.getsize(csv_path) / 2**20:.1f} MB"
+        )
+
+        check_parity(csv_path, args.parity_sample)
+        print(f"parity ok on first {min(args.rows, args.parity_sample):,} rows")
+
+        for name, fn in [("pandas .apply", apply_path), ("duckdb sql", sql_path)]:
+            m = measure(name, fn, csv_path)
+            assert m.result == args.rows, f"{name} normalised {m.result} rows"
+            print(m)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Local stand-ins for cloud clients, so publish paths run offline.
+"""
+
+import bisect
+import dataclasses
+import datetime
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+# read uploads in chunks like the real client's resumable upload does, instead of all at once
+UPLOAD_CHUNK_SIZE = 8 * 2**20
+# ranged GET size of the real blob downloader
+DOWNLOAD_CHUNK_SIZE = 4 * 2**20
+
+
+@dataclasses.dataclass
+class FakeJob:
+    value: Any = None
+
+    def result(self):
+        return self.value
+
+
+class FakeBigQueryClient:
+    """
+    Records what a `bigquery.Client` would have been asked to do.
+    Loads count the bytes they receive; queries and deletes are only recorded.
+    """
+
+    def __init__(
+        self, project: str = "project", fail_after_loads: Optional[int] = None
+    ):
+        self.project = project
+        # simulate a job failure once this many loads went through
+        self.fail_after_loads = fail_after_loads
+        self.created: List[Any] = []
+        self.loads: List[Dict[str, Any]] = []
+        self.queries: List[str] = []
+        self.deleted: List[str] = []
+        self._lock = threading.Lock()
+
+    def create_table(self, table, exists_ok: bool = False, **kwargs):
+        with self._lock:
+            self.created.append(table)
+        return table
+
+    def update_table(self, table, fields: List[str], **kwargs):
+        return table
+
+    def load_table_from_file(
+        self, file_obj, destination, job_config=None, **kwargs
+    ) -> FakeJob:
+        with self._lock:
+            if (
+                self.fail_after_loads is not None
+                and len(self.loads) >= self.fail_after_loads
+            ):
+                raise RuntimeError(f"Simulated load failure for {destination}")
+        size = 0
+        while chunk := file_obj.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+        with self._lock:
+            self.loads.append(
+                {
+                    "destination": str(destination),
+                    "bytes": size,
+                    "job_config": job_config,
+                }
+            )
+        return FakeJob()
+
+    def load_table_from_dataframe(
+        self, dataframe: pd.DataFrame, destination, job_config=None, **kwargs
+    ) -> FakeJob:
+        # the real client serialises the frame to Parquet before uploading it
+        buffer = io.BytesIO()
+        dataframe.to_parquet(buffer)
+        buffer.seek(0)
+        return self.load_table_from_file(buffer, destination, job_config)
+
+    def query(self, sql: str, job_config: Optional[Any] = None, **kwargs) -> FakeJob:
+        self.queries.append(sql)
+        return FakeJob()
+
+    def delete_table(self, table, not_found_ok: bool = False, **kwargs):
+        self.deleted.append(str(table))
+
+
+@dataclasses.dataclass
+class FakeBlobProperties:
+    name: str
+    size: int
+    last_modified: datetime.datetime
+
+
+class FakeStorageStreamDownloader:
+    """
+    Downloads byte ranges of a local file, `max_concurrency` at a time, in order.
+    """
+
+    def __init__(self, path: str, max_concurrency: int = 1):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.max_concurrency = max_concurrency
+
+    def _read_range(self, offset: int) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(DOWNLOAD_CHUNK_SIZE)
+
+    def chunks(self) -> Iterator[bytes]:
+        offsets = range(0, self.size, DOWNLOAD_CHUNK_SIZE)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            # submit a window at a time, so only max_concurrency chunks are in memory
+            for start in range(0, len(offsets), self.max_concurrency):
+                window = offsets[start : start + self.max_concurrency]
+                yield from pool.map(self._read_range, window)
+
+    def readinto(self, stream: BinaryIO) -> int:
+        written = 0
+        for chunk in self.chunks():
+            written += stream.write(chunk)
+        return written
+
+    def readall(self) -> bytes:
+        return b"".join(self.chunks())
+
+
+class FakeBlobClient:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def download_blob(self, max_concurrency: int = 1, **kwargs):
+        return FakeStorageStreamDownloader(self.path, max_concurrency)
+
+
+class FakeContainerClient:
+    """
+    A `ContainerClient` over a local directory: blob names are paths relative to `root`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def list_blobs(self, name_starts_with: Optional[str] = None, **kwargs):
+        for dir_path, _, file_names in sorted(os.walk(self.root)):
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name_starts_with and not name.startswith(name_starts_with):
+                    continue
+                stat = os.stat(path)
+                yield FakeBlobProperties(
+                    name,
+                    stat.st_size,
+                    datetime.datetime.fromtimestamp(
+                        stat.st_mtime, datetime.timezone.utc
+                    ),
+                )
+
+    def get_blob_client(self, blob: str) -> FakeBlobClient:
+        return FakeBlobClient(os.path.join(self.root, blob))
+
+
+@dataclasses.dataclass
+class FakeBlobPrefix:
+    name: str
+
+
+class FakeBlobListing:
+    """
+    A container holding only blob names, for listing-heavy code.
+    Counts the items every call returns, which is what the service pages through,
+    and serves delimiter listings in time proportional to that like the service does.
+    """
+
+    def __init__(self, names: List[str]):
+        self.names = sorted(names)
+        self.calls = 0
+        self.items_listed = 0
+
+    def add(self, name: str):
+        bisect.insort(self.names, name)
+
+    def _from(self, prefix: str) -> int:
+        return bisect.bisect_left(self.names, prefix)
+
+    def list_blobs(self, name_starts_with: Optional[str] = None, **kwargs):
+        self.calls += 1
+        prefix = name_starts_with or ""
+        for name in self.names[self._from(prefix) :]:
+            if not name.startswith(prefix):
+                break
+            self.items_listed += 1
+            yield FakeBlobProperties(name, 0, datetime.datetime.min)
+
+    def walk_blobs(
+        self, name_starts_with: Optional[str] = None, delimiter: str = "/", **kwargs
+    ):
+        self.calls += 1
+        prefix = name_starts_with or ""
+        i = self._from(prefix)
+        while i < len(self.names) and self.names[i].startswith(prefix):
+            name = self.names[i]
+            cut = name.find(delimiter, len(prefix))
+            self.items_listed += 1
+            if cut == -1:
+                yield FakeBlobProperties(name, 0, datetime.datetime.min)
+                i += 1
+            else:
+                child = name[: cut + 1]
+                yield FakeBlobPrefix(child)
+                # skip everything under the child prefix, the service rolls it up
+                i = bisect.bisect_left(self.names, child + "\U0010ffff", i)
@@ -0,0 +1,325 @@
+"""
+Deterministic synthetic inputs laid out like the real `data/` directory.
+Ids line up across files (routes, stop names, vehicle numbers), so every query joins.
+"""
+
+import csv
+import dataclasses
+import datetime
+import os
+import random
+from typing import Dict, List, Optional
+
+
+@dataclasses.dataclass(frozen=True)
+class Scale:
+    routes: int
+    trips_per_route: int
+    stops_per_trip: int
+    stops: int
+    vehicles: int
+    delays_per_hour: int
+    weather_stations: int = 1
+
+
+SCALES: Dict[str, Scale] = {
+    "tiny": Scale(
+        routes=5,
+        trips_per_route=8,
+        stops_per_trip=10,
+        stops=60,
+        vehicles=20,
+        delays_per_hour=50,
+    ),
+    "small": Scale(
+        routes=50,
+        trips_per_route=40,
+        stops_per_trip=20,
+        stops=1000,
+        vehicles=300,
+        delays_per_hour=2_000,
+    ),
+    # roughly the size of the Warsaw feed
+    "city": Scale(
+        routes=300,
+        trips_per_route=400,
+        stops_per_trip=30,
+        stops=7_000,
+        vehicles=3_000,
+        delays_per_hour=20_000,
+        weather_stations=4,
+    ),
+}
+
+# synoptic stations around Warsaw, the first one is what the pipeline used to hardcode
+WEATHER_STATION_IDS = ["12375", "12360", "12385", "12280"]
+
+
+def weather_station_id(i: int) -> str:
+    # made up ids past the real ones, for scaling runs over many stations
+    return WEATHER_STATION_IDS[i] if i < len(WEATHER_STATION_IDS) else str(90000 + i)
+
+
+def route_id(i: int) -> str:
+    return str(100 + i)
+
+
+def stop_id(i: int) -> str:
+    # two posts share a stop name, like "Centrum 01" / "Centrum 02"
+    return f"{i // 2:04d}{i % 2 + 1:02d}"
+
+
+def stop_name(i: int) -> str:
+    return f"Stop {i // 2}"
+
+
+def vehicle_number(i: int) -> str:
+    return str(1000 + i)
+
+
+def _open_csv(path: str, header: List[str]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    f = open(path, "w", newline="")
+    writer = csv.writer(f)
+    writer.writerow(header)
+    return f, writer
+
+
+def _format_delay(delay: int) -> str:
+    return f"{-delay} min przed czasem" if delay < 0 else f"{delay} min"
+
+
+def write_stop_times(path: str, rows: int, seed: int = 0):
+    """
+    Standalone GTFS `stop_times.csv`, 20 stops per trip.
+    """
+    rng = random.Random(seed)
+    f, writer = _open_csv(
+        path,
+        [
+            "trip_id",
+            "arrival_time",
+            "departure_time",
+            "stop_id",
+            "stop_sequence",
+            "pickup_type",
+            "drop_off_type",
+            "shape_dist_traveled",
+        ],
+    )
+    with f:
+        for i in range(rows):
+            trip, seq = divmod(i, 20)
+            minutes = 300 + trip % 1000 + seq * 2
+            hhmmss = f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+            writer.writerow(
+                [
+                    f"{trip % 300}/{trip}",
+                    hhmmss,
+                    hhmmss,
+                    stop_id(rng.randrange(7000)),
+                    seq,
+                    0,
+                    0,
+                    round(seq * rng.uniform(0.3, 0.9), 3),
+                ]
+            )
+
+
+def write_delays(
+    path: str,
+    rows: int,
+    day: str = "2024-12-25",
+    hour: Optional[int] = None,
+    scale: Scale = SCALES["city"],
+    seed: int = 0,
+):
+    """
+    Traffic delays csv in the scraper's format, e.g. "3 min" / "2 min przed czasem".
+    Timestamps spread over the whole day, or over `hour` when given.
+    """
+    rng = random.Random(seed)
+    span = 3600 if hour is not None else 86400
+    offset = (hour or 0) * 3600
+    f, writer = _open_csv(
+        path, ["Timestamp", "Route", "Vehicle No", "Stop Name", "Delay"]
+    )
+    with f:
+        for i in range(rows):
+            seconds = offset + i * span // rows
+            writer.writerow(
+                [
+                    f"{day}T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}",
+                    route_id(rng.randrange(scale.routes)),
+                    (
+                        ""
+                        if rng.random() < 0.05
+                        else vehicle_number(rng.randrange(scale.vehicles))
+                    ),
+                    stop_name(rng.randrange(scale.stops)),
+                    _format_delay(rng.randint(-10, 30)),
+                ]
+            )
+
+
+def write_gtfs(root: str, day: datetime.date, scale: Scale, seed: int = 0):
+    rng = random.Random(seed)
+    gtfs_dir = os.path.join(
+        root, "data", "gtfs", str(day.year), str(day.month), str(day.day)
+    )
+
+    f, writer = _open_csv(
+        os.path.join(gtfs_dir, "routes.csv"),
+        ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"],
+    )
+    with f:
+        for r in range(scale.routes):
+            # every fifth line is a tram, the rest are buses
+            writer.writerow(
+                [route_id(r), 1, route_id(r), f"Route {r}", 0 if r % 5 == 0 else 3]
+            )
+
+    f, writer = _open_csv(
+        os.path.join(gtfs_dir, "stops.csv"),
+        ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+    )
+    with f:
+        for s in range(scale.stops):
+            writer.writerow(
+                [
+                    stop_id(s),
+                    stop_name(s),
+                    round(52.1 + rng.random() * 0.25, 6),
+                    round(20.85 + rng.random() * 0.35, 6),
+                ]
+            )
+
+    trips_f, trips = _open_csv(
+        os.path.join(gtfs_dir, "trips.csv"),
+        ["route_id", "service_id", "trip_id", "trip_headsign", "direction_id"],
+    )
+    times_f, times = _open_csv(
+        os.path.join(gtfs_dir, "stop_times.csv"),
+        [
+            "trip_id",
+            "arrival_time",
+            "departure_time",
+            "stop_id",
+            "stop_sequence",
+            "shape_dist_traveled",
+        ],
+    )
+    with trips_f, times_f:
+        for r in range(scale.routes):
+            first_stop = rng.randrange(scale.stops)
+            # a couple of variants per route, so the most frequent length is meaningful
+            variants = [scale.stops_per_trip - v for v in range(3)]
+            for t in range(scale.trips_per_route):
+                trip_id = f"{route_id(r)}/{t}"
+                direction = t % 2
+                trips.writerow(
+                    [route_id(r), "weekday", trip_id, f"Route {r}", direction]
+                )
+                stops = variants[0] if t % 4 else variants[t % len(variants)]
+                start = 240 + t * 1440 // scale.trips_per_route
+                for seq in range(stops):
+                    minutes = start + seq * 2
+                    hhmmss = f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+                    times.writerow(
+                        [
+                            trip_id,
+                            hhmmss,
+                            hhmmss,
+                            stop_id((first_stop + seq) % scale.stops),
+                            seq,
+                            round(seq * 0.6, 3),
+                        ]
+                    )
+
+
+def write_vehicles(root: str, scale: Scale, seed: int = 0):
+    rng = random.Random(seed)
+    models = [("Solaris", "Urbino 18"), ("Mercedes", "Citaro"), ("PESA", "Jazz Duo")]
+    f, writer = _open_csv(
+        os.path.join(root, "data", "ztm_vehicles_detailed.csv"),
+        ["vehicle_number", "carrier", "manufacturer", "type", "production_year"],
+    )
+    with f:
+        for v in range(scale.vehicles):
+            manufacturer, model = models[v % len(models)]
+            writer.writerow(
+                [
+                    vehicle_number(v),
+                    f"Carrier {v % 4}",
+                    manufacturer,
+                    model,
+                    rng.randrange(2000, 2025),
+                ]
+            )
+
+
+def write_delays_day(root: str, day: datetime.date, scale: Scale, seed: int = 0):
+    """
+    One delays csv per hour of `day`, like the hourly scraper drops them.
+    """
+    for hour in range(24):
+        write_delays(
+            os.path.join(
+                root, "data", "delays", day.strftime("%Y/%m/%d"), f"{hour:02d}.csv"
+            ),
+            scale.delays_per_hour,
+            day=day.isoformat(),
+            hour=hour,
+            scale=scale,
+            seed=seed * 100 + hour,
+        )
+
+
+def write_weather_day(root: str, day: datetime.date, scale: Scale, seed: int = 0):
+    """
+    One IMGW synop csv per station with 24 hourly measurements.
+    """
+    rng = random.Random(seed)
+    weather_dir = os.path.join(root, "data", "weather", day.strftime("%Y/%m/%d"))
+    for station in map(weather_station_id, range(scale.weather_stations)):
+        f, writer = _open_csv(
+            os.path.join(weather_dir, f"{station}.csv"),
+            [
+                "id_stacji",
+                "stacja",
+                "data_pomiaru",
+                "godzina_pomiaru",
+                "temperatura",
+                "predkosc_wiatru",
+                "kierunek_wiatru",
+                "wilgotnosc_wzgledna",
+                "suma_opadu",
+                "cisnienie",
+            ],
+        )
+        with f:
+            for hour in range(24):
+                writer.writerow(
+                    [
+                        station,
+                        f"Station {station}",
+                        day.isoformat(),
+                        hour,
+                        round(rng.uniform(-10, 30), 1),
+                        rng.randrange(0, 20),
+                        rng.randrange(0, 360, 10),
+                        round(rng.uniform(40, 100), 1),
+                        rng.choice([0, 0, 0, 0.4, 2.5, 7.1]),
+                        round(rng.uniform(990, 1030), 1),
+                    ]
+                )
+
+
+def write_dataset(root: str, day: datetime.date, scale: Scale, seed: int = 0):
+    """
+    Every input the loaders read for `day`, under `root/data`.
+    """
+    write_gtfs(root, day, scale, seed)
+    write_vehicles(root, scale, seed)
+    write_delays_day(root, day, scale, seed)
+    write_weather_day(root, day, scale, seed)
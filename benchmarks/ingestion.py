@@ -0,0 +1,66 @@
+"""
+Peak RSS and wall time of loading a large GTFS `stop_times.csv` into DuckDB,
+the old pandas round-trip against `src.ingestion`.
+
+    python -m benchmarks.ingestion --rows 5000000
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import measure
+from benchmarks.generators import write_stop_times
+
+
+def pandas_path(csv_path: str, db_path: str) -> int:
+    import duckdb
+    import pandas as pd
+
+    with duckdb.connect(db_path) as dbsession:
+        df = pd.read_csv(csv_path)
+        dbsession.register("_tmp_stop_times", df)
+        dbsession.execute(
+            "create or replace table stop_times as select * from _tmp_stop_times"
+        )
+        dbsession.unregister("_tmp_stop_times")
+        return dbsession.execute("select count(*) from stop_times").fetchone()[0]
+
+
+def duckdb_path(csv_path: str, db_path: str) -> int:
+    import duckdb
+
+    from src.gtfs import GTFS_COLUMN_TYPES
+    from src.ingestion import load_csv_into_duckdb
+
+    with duckdb.connect(db_path) as dbsession:
+        load_csv_into_duckdb(
+            dbsession, "stop_times", [csv_path], GTFS_COLUMN_TYPES["stop_times"]
+        )
+        return dbsession.execute("select count(*) from stop_times").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "stop_times.csv")
+        write_stop_times(csv_path, args.rows)
+        print(
+            f"stop_times.csv: {args.rows:,} rows, {os.path.getsize(csv_path) / 2**20:.1f} MB"
+        )
+
+        for name, fn in [
+            ("pandas read_csv + register", pandas_path),
+            ("duckdb read_csv", duckdb_path),
+        ]:
+            db_path = os.path.join(tmp, f"{fn.__name__}.duckdb")
+            m = measure(name, fn, csv_path, db_path)
+            assert m.result == args.rows, f"{name} loaded {m.result} rows"
+            print(m)
+
+
+if __name__ == "__main__":
+    main()
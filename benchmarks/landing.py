@@ -0,0 +1,84 @@
+"""
+Raw csv against the Parquet landing zone: a generated day is loaded through both paths,
+for the whole day and for a single hour like the hourly DAG runs. Reports runtime and the
+bytes of input files each path has to read; the landing path is timed cold (converting) and warm.
+
+    python -m benchmarks.landing --scale city
+"""
+
+import argparse
+import datetime
+import glob
+import os
+import tempfile
+from typing import Optional
+
+from benchmarks.common import measure
+from benchmarks.generators import SCALES, write_dataset
+
+DAY = datetime.date(2024, 12, 25)
+HOUR = 10
+
+
+def load(root: str, hour: Optional[int], landing_dir: Optional[str]) -> int:
+    import duckdb
+    import pendulum
+
+    from src.delays import load_delays_into_duckdb
+    from src.gtfs import load_gtfs_into_duckdb
+    from src.weather import load_weather_into_duckdb
+
+    os.chdir(root)
+    as_of = pendulum.date(DAY.year, DAY.month, DAY.day)
+    with duckdb.connect() as dbsession:
+        load_gtfs_into_duckdb(as_of, dbsession, landing_dir=landing_dir)
+        load_delays_into_duckdb(as_of, dbsession, hour=hour, landing_dir=landing_dir)
+        load_weather_into_duckdb(as_of, dbsession, landing_dir=landing_dir)
+        return dbsession.execute("select count(*) from delays").fetchone()[0]
+
+
+def input_mb(pattern: str) -> float:
+    return sum(os.path.getsize(p) for p in glob.glob(pattern, recursive=True)) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=SCALES, default="city")
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    with tempfile.TemporaryDirectory() as tmp:
+        write_dataset(tmp, DAY, scale)
+        landing_dir = os.path.join(tmp, "landing")
+        day = DAY.isoformat()
+        csv_mb = input_mb(os.path.join(tmp, "data", "**", "*.csv")) - input_mb(
+            os.path.join(tmp, "data", "*.csv")
+        )
+
+        day_rows = scale.delays_per_hour * 24
+        runs = [
+            ("day, csv", None, None, day_rows),
+            ("hour, csv", HOUR, None, scale.delays_per_hour),
+            ("day, landing cold", None, landing_dir, day_rows),
+            ("day, landing warm", None, landing_dir, day_rows),
+            ("hour, landing warm", HOUR, landing_dir, scale.delays_per_hour),
+        ]
+        for name, hour, landing, rows in runs:
+            m = measure(name, load, tmp, hour, landing)
+            assert m.result == rows, f"{name} loaded {m.result} delays"
+            read_mb = csv_mb
+            if "warm" in name:
+                delays_partition = "**" if hour is None else f"hour={hour}"
+                read_mb = sum(
+                    input_mb(os.path.join(landing_dir, p, "*.parquet"))
+                    for p in [
+                        f"delays/day={day}/{delays_partition}",
+                        "gtfs/*/*",
+                        f"weather/day={day}",
+                    ]
+                )
+            print(f"{m} {read_mb:>9.1f} MB read")
+
+
+if __name__ == "__main__":
+    main()
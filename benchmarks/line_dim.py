@@ -0,0 +1,149 @@
+"""
+LineDim on a full city feed: the old query, which joins trips to stop_times twice and fans
+routes out over every delay, against `trip_stats` plus the single-pass `LINE_DIM_QUERY`.
+Checks that route lengths and stop counts agree, then times both on the same loaded database.
+
+    python -m benchmarks.line_dim --scale city
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from benchmarks.common import measure
+from benchmarks.generators import SCALES, write_dataset
+
+DAY = datetime.date(2024, 12, 25)
+
+OLD_LINE_DIM_QUERY = """
+with trip_lengths as (
+    select t.route_id, t.trip_id, max(st.shape_dist_traveled) as trip_len
+    from trips t
+    left join stop_times st on t.trip_id = st.trip_id
+    group by t.route_id, t.trip_id
+),
+trip_len_mode as (
+    select
+        route_id,
+        trip_len,
+        row_number() over (partition by route_id order by count(*) desc, trip_len desc) as rn
+    from trip_lengths
+    group by route_id, trip_len
+),
+stops_per_trip as (
+    select t.route_id, t.trip_id, count(distinct st.stop_id) as stops_per_trip
+    from trips t
+    left join stop_times st on t.trip_id = st.trip_id
+    group by t.route_id, t.trip_id
+),
+stops_mode as (
+    select
+        route_id,
+        stops_per_trip,
+        row_number() over (partition by route_id order by count(*) desc, stops_per_trip desc) as rn
+    from stops_per_trip
+    group by route_id, stops_per_trip
+)
+select
+    r.route_id as id,
+    v.carrier as operator,
+    coalesce(rl.trip_len, 0) as route_length_km,
+    coalesce(rs.stops_per_trip, 0) as stops_amount
+from routes r
+left join delays d on r.route_id = d."Route"
+left join vehicles v on d."Vehicle No" = v.vehicle_number
+left join trip_len_mode rl on r.route_id = rl.route_id and rl.rn = 1
+left join stops_mode rs on r.route_id = rs.route_id and rs.rn = 1
+"""
+
+
+def load(db_path: str):
+    import duckdb
+    import pendulum
+
+    from src.delays import load_delays_into_duckdb
+    from src.gtfs import load_gtfs_into_duckdb
+    from src.vehicles import load_vehicles_into_duckdb
+
+    as_of = pendulum.date(DAY.year, DAY.month, DAY.day)
+    with duckdb.connect(db_path) as dbsession:
+        load_gtfs_into_duckdb(as_of, dbsession)
+        load_delays_into_duckdb(as_of, dbsession)
+        load_vehicles_into_duckdb(dbsession)
+
+
+def old_query(db_path: str) -> int:
+    import duckdb
+
+    with duckdb.connect(db_path, read_only=True) as dbsession:
+        return dbsession.execute(
+            f"select count(*) from ({OLD_LINE_DIM_QUERY})"
+        ).fetchone()[0]
+
+
+def new_query(db_path: str, rebuild_trip_stats: bool) -> int:
+    import duckdb
+
+    from src.gtfs import TRIP_STATS_QUERY
+    from src.queries import LINE_DIM_QUERY
+
+    with duckdb.connect(db_path) as dbsession:
+        if rebuild_trip_stats:
+            dbsession.execute(
+                f"create or replace table trip_stats as {TRIP_STATS_QUERY}"
+            )
+        query = f"select count(*) from ({LINE_DIM_QUERY})"
+        return dbsession.execute(query).fetchone()[0]
+
+
+def check_parity(db_path: str):
+    import duckdb
+
+    from src.queries import LINE_DIM_QUERY
+
+    with duckdb.connect(db_path, read_only=True) as dbsession:
+        mismatched = dbsession.execute(f"""
+            select count(*) from (
+                select distinct id, route_length_km, stops_amount from ({OLD_LINE_DIM_QUERY})
+            ) old
+            full join ({LINE_DIM_QUERY}) new using (id)
+            where old.route_length_km is distinct from new.route_length_km
+                or old.stops_amount is distinct from new.stops_amount
+            """).fetchone()[0]
+        duplicated = dbsession.execute(
+            f"select count(*) - count(distinct id) from ({LINE_DIM_QUERY})"
+        ).fetchone()[0]
+    assert mismatched == 0, f"{mismatched} routes differ"
+    assert duplicated == 0, f"{duplicated} duplicated routes"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=SCALES, default="city")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        db_path = os.path.join(tmp, "run.duckdb")
+        start = time.perf_counter()
+        load(db_path)
+        print(f"scale {args.scale}: loaded in {time.perf_counter() - start:.2f}s")
+
+        check_parity(db_path)
+        print("parity ok: same route lengths and stop counts, one row per route")
+
+        for _ in range(args.repeat):
+            for m in [
+                measure("old query", old_query, db_path),
+                measure("trip_stats + new query", new_query, db_path, True),
+                measure("new query on cached trip_stats", new_query, db_path, False),
+            ]:
+                print(f"{m}  {m.result:>9,} rows")
+
+
+if __name__ == "__main__":
+    main()
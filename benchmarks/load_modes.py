@@ -0,0 +1,146 @@
+"""
+Sharded against consolidated loading of one hourly run, end to end. Every DAG task of a mode
+runs in a fresh process, so each pays for its interpreter, imports and database files like an
+Airflow task does; scheduling delays between tasks come on top and aren't included.
+Checks both modes produce the same tables.
+
+    python -m benchmarks.load_modes --scale small
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.common import measure
+from benchmarks.generators import SCALES, write_dataset
+from src.settings import LOAD_MODES
+from src.shards import DUCKDB_SHARDS
+
+DAY = datetime.date(2024, 12, 25)
+HOUR = 10
+TABLES = [*(t for tables in DUCKDB_SHARDS.values() for t in tables), "time_dim"]
+
+
+def _loaders() -> Dict[str, Callable]:
+    import pendulum
+
+    from benchmarks.common import load_time_dim
+    from src.delays import load_delays_into_duckdb
+    from src.gtfs import load_gtfs_into_duckdb
+    from src.vehicles import load_vehicles_into_duckdb
+    from src.weather import load_weather_into_duckdb
+
+    as_of = pendulum.date(DAY.year, DAY.month, DAY.day)
+    return {
+        "gtfs": lambda s: load_gtfs_into_duckdb(as_of, s),
+        "delays": lambda s: load_delays_into_duckdb(as_of, s, hour=HOUR),
+        "vehicles": lambda s: load_vehicles_into_duckdb(s),
+        "weather": lambda s: load_weather_into_duckdb(as_of, s),
+        "time_dim": lambda s: load_time_dim(s, DAY, HOUR),
+    }
+
+
+def load_shard_task(shard: str, path: str):
+    from src.sessions import connect_duckdb
+
+    with connect_duckdb(path, "load") as dbsession:
+        _loaders()[shard](dbsession)
+
+
+def merge_task(run_path: str, shard_paths: Dict[str, str]):
+    from src.sessions import connect_duckdb
+    from src.shards import merge_shard_databases
+
+    with connect_duckdb(run_path, "merge") as dbsession:
+        merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS, mode="copy")
+        _loaders()["time_dim"](dbsession)
+
+
+def verify_task(run_path: str) -> List[Tuple[str, int, int]]:
+    from src.sessions import connect_duckdb
+
+    with connect_duckdb(run_path, "merge") as dbsession:
+        return _checksums(dbsession)
+
+
+def consolidated_task(run_path: str) -> List[Tuple[str, int, int]]:
+    from src.sessions import connect_duckdb
+    from src.shards import load_concurrently
+
+    with connect_duckdb(run_path, "load") as dbsession:
+        load_concurrently(dbsession, _loaders())
+        return _checksums(dbsession)
+
+
+def _checksums(dbsession) -> List[Tuple[str, int, int]]:
+    return [
+        (t, *dbsession.execute(f"select count(*), sum(hash(q)) from {t} q").fetchone())
+        for t in TABLES
+    ]
+
+
+def _task(name: str, fn, *args) -> Tuple[float, object]:
+    # spawning the process and importing count, as they do for a DAG task
+    start = time.perf_counter()
+    result = measure(name, fn, *args).result
+    return time.perf_counter() - start, result
+
+
+def run_sharded(tmp: str) -> Tuple[Dict[str, float], list]:
+    shard_paths = {s: os.path.join(tmp, f"sharded-{s}.duckdb") for s in DUCKDB_SHARDS}
+    seconds = {
+        shard: _task(shard, load_shard_task, shard, path)[0]
+        for shard, path in shard_paths.items()
+    }
+    run_path = os.path.join(tmp, "sharded.duckdb")
+    seconds["merge_shards"] = _task("merge", merge_task, run_path, shard_paths)[0]
+    seconds["verify"], checksums = _task("verify", verify_task, run_path)
+    return seconds, checksums
+
+
+def run_consolidated(tmp: str) -> Tuple[Dict[str, float], list]:
+    run_path = os.path.join(tmp, "consolidated.duckdb")
+    wall_s, checksums = _task("load_run", consolidated_task, run_path)
+    return {"load_run": wall_s}, checksums
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        # warm the page cache, so neither mode reads the inputs from disk first
+        run_consolidated(tmp)
+        os.remove(os.path.join(tmp, "consolidated.duckdb"))
+
+        results = {
+            "sharded": run_sharded(tmp),
+            "consolidated": run_consolidated(tmp),
+        }
+
+    assert results["sharded"][1] == results["consolidated"][1], results
+    print(
+        f"scale {args.scale}, hour {HOUR}: both modes load the same {len(TABLES)} tables"
+    )
+    for mode in LOAD_MODES:
+        seconds = results[mode][0]
+        # the loader tasks of the sharded mode may run side by side
+        loaders = [s for task, s in seconds.items() if task in DUCKDB_SHARDS]
+        critical = max(loaders, default=0.0) + sum(
+            s for task, s in seconds.items() if task not in DUCKDB_SHARDS
+        )
+        tasks = ", ".join(f"{task} {s:.2f}s" for task, s in seconds.items())
+        print(
+            f"{mode:<13} {len(seconds)} tasks, {sum(seconds.values()):>6.2f}s one after another, "
+            f"{critical:>6.2f}s critical path ({tasks})"
+        )
+
+
+if __name__ == "__main__":
+    main()
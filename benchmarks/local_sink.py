@@ -0,0 +1,117 @@
+"""
+End-to-end publish throughput of `LocalWarehouseSink`, next to `BigQuerySink` on
+`FakeBigQueryClient` for the cost of the shared export. Publishes `--runs` hourly runs into
+one warehouse, checks it holds every distinct key exactly once and that republishing the
+last run inserts nothing.
+
+    python -m benchmarks.local_sink --scale city
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import duckdb
+
+from benchmarks.common import build_shards, load_time_dim
+from benchmarks.fakes import FakeBigQueryClient
+from benchmarks.generators import SCALES, write_dataset
+from src.bigquery import deduplicated_query
+from src.enums import Table
+from src.shards import DUCKDB_SHARDS, merge_shard_databases
+from src.sinks import BigQuerySink, LocalWarehouseSink
+
+DAY = datetime.date(2024, 12, 25)
+
+
+def prepare_hour(day_path: str, run_path: str, hour: int):
+    shutil.copy(day_path, run_path)
+    with duckdb.connect(run_path) as dbsession:
+        dbsession.execute('delete from delays where hour("Timestamp") != ?', [hour])
+        load_time_dim(dbsession, DAY, hour)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--runs", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        shard_paths = build_shards(os.path.join(tmp, "shards"), DAY, hour=None)
+        day_path = os.path.join(tmp, "day.duckdb")
+        with duckdb.connect(day_path) as dbsession:
+            merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS, mode="copy")
+
+        run_path = os.path.join(tmp, "run.duckdb")
+        sinks = {
+            "local": LocalWarehouseSink(os.path.join(tmp, "warehouse.duckdb")),
+            "bigquery": BigQuerySink(FakeBigQueryClient(), "project", "dataset"),
+        }
+        rows = {name: 0 for name in sinks}
+        seconds = {name: 0.0 for name in sinks}
+        distinct = {table: set() for table in Table}
+        for hour in range(args.runs):
+            prepare_hour(day_path, run_path, hour)
+            with duckdb.connect(run_path, read_only=True) as dbsession:
+                for name, sink in sinks.items():
+                    start = time.perf_counter()
+                    published = sink.publish_tables(dbsession, list(Table))
+                    seconds[name] += time.perf_counter() - start
+                    rows[name] += sum(published.values())
+                for table in Table:
+                    keys = ", ".join(f'"{k}"' for k in table.unique_key_columns)
+                    distinct[table].update(
+                        dbsession.execute(
+                            f"select {keys} from ({deduplicated_query(dbsession, table)})"
+                        ).fetchall()
+                    )
+
+        warehouse = sinks["local"]
+        with duckdb.connect(warehouse.warehouse_path, read_only=True) as dbsession:
+            for table in Table:
+                keys = ", ".join(f'"{k}"' for k in table.unique_key_columns)
+                count, distinct_keys = dbsession.execute(
+                    f"select count(*), count(distinct ({keys})) "
+                    f"from {table.bigquery_table}"
+                ).fetchone()
+                assert count == distinct_keys == len(distinct[table]), (
+                    table,
+                    count,
+                    distinct_keys,
+                    len(distinct[table]),
+                )
+        with duckdb.connect(run_path, read_only=True) as dbsession:
+            with duckdb.connect(warehouse.warehouse_path, read_only=True) as before:
+                counts = [
+                    before.execute(
+                        f"select count(*) from {t.bigquery_table}"
+                    ).fetchone()
+                    for t in Table
+                ]
+            warehouse.publish_tables(dbsession, list(Table))
+            with duckdb.connect(warehouse.warehouse_path, read_only=True) as after:
+                assert counts == [
+                    after.execute(f"select count(*) from {t.bigquery_table}").fetchone()
+                    for t in Table
+                ]
+
+    print(
+        f"scale {args.scale}, {args.runs} hourly runs, "
+        f"{sum(len(keys) for keys in distinct.values()):,} distinct keys in the warehouse"
+    )
+    for name in sinks:
+        print(
+            f"{name:<9} {seconds[name]:>7.2f}s {rows[name]:>11,} rows staged "
+            f"{rows[name] / seconds[name]:>11,.0f} rows/s"
+        )
+    print("warehouse ok: every key once, republishing inserts nothing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Shard merge modes: physical copy into the run database against views over attached shards.
+Reports the merge itself and the query time of every `Table` on the merged database.
+
+    python -m benchmarks.merge --scale city
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import duckdb
+
+from benchmarks.common import build_shards, load_time_dim
+from benchmarks.generators import SCALES, write_dataset
+from src.enums import Table
+from src.shards import DUCKDB_SHARDS, MERGE_MODES, attach_shards, merge_shard_databases
+
+DAY = datetime.date(2024, 12, 25)
+HOUR = 10
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        shard_paths = build_shards(os.path.join(tmp, "shards"), DAY, HOUR)
+        shard_bytes = sum(os.path.getsize(p) for p in shard_paths.values())
+        print(f"scale {args.scale}: {shard_bytes / 2**20:.1f} MB of shards")
+
+        for mode in MERGE_MODES:
+            mode_dir = os.path.join(tmp, mode)
+            shutil.copytree(os.path.join(tmp, "shards"), mode_dir)
+            run_path = os.path.join(mode_dir, "run.duckdb")
+            start = time.perf_counter()
+            with duckdb.connect(run_path) as dbsession:
+                merge_shard_databases(
+                    dbsession,
+                    {s: os.path.join(mode_dir, f"{s}.duckdb") for s in DUCKDB_SHARDS},
+                    DUCKDB_SHARDS,
+                    mode=mode,
+                )
+                load_time_dim(dbsession, DAY, HOUR)
+            merge_s = time.perf_counter() - start
+            print(
+                f"{mode:<8} merge {merge_s:>8.3f}s, run database {os.path.getsize(run_path) / 2**20:.1f} MB"
+            )
+
+            with duckdb.connect(run_path, read_only=True) as dbsession:
+                attach_shards(dbsession)
+                for table in Table:
+                    timings = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        rows = len(dbsession.execute(table.duckdb_query).fetchall())
+                        timings.append(time.perf_counter() - start)
+                    print(
+                        f"{mode:<8} {table.bigquery_table:<12} {min(timings):>8.3f}s  {rows:,} rows"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Partitioned and clustered BigQuery targets: publishes an hourly run to `FakeBigQueryClient`
+and checks the target tables it creates and the partition predicate of each MERGE.
+Reports how many partitions of a history of `--history-days` an hourly MERGE still scans.
+
+    python -m benchmarks.merge_pruning --scale small
+"""
+
+import argparse
+import datetime
+import os
+import re
+import tempfile
+
+import duckdb
+
+from benchmarks.common import build_shards, load_time_dim
+from benchmarks.fakes import FakeBigQueryClient
+from benchmarks.generators import SCALES, write_dataset
+from src.bigquery import publish_table_to_bigquery
+from src.enums import Table
+from src.shards import DUCKDB_SHARDS, merge_shard_databases
+
+DAY = datetime.date(2024, 12, 25)
+HOUR = 10
+
+
+def _partition(time_id: int, table: Table) -> int:
+    return (time_id - table.partitioning.start) // table.partitioning.interval
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--history-days", type=int, default=365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, SCALES[args.scale])
+        shard_paths = build_shards(os.path.join(tmp, "shards"), DAY, HOUR)
+        run_path = os.path.join(tmp, "run.duckdb")
+        with duckdb.connect(run_path) as dbsession:
+            merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS, mode="copy")
+            load_time_dim(dbsession, DAY, HOUR)
+
+        client = FakeBigQueryClient()
+        with duckdb.connect(run_path, read_only=True) as dbsession:
+            for table in Table:
+                publish_table_to_bigquery(
+                    client, dbsession, table, "project", "dataset"
+                )
+
+    targets = {t.table_id: t for t in client.created if "_staging_" not in t.table_id}
+    for table in Table:
+        target = targets[table.bigquery_table]
+        assert [f.name for f in target.schema] == [f.name for f in table.schema]
+        assert (target.clustering_fields or []) == table.clustering_columns
+        merge = next(q for q in client.queries if f".{table.bigquery_table}`" in q)
+        predicate = re.search(r"BETWEEN (\d+) AND (\d+)", merge)
+        if table.partitioning is None:
+            assert target.range_partitioning is None and predicate is None
+            continue
+
+        assert target.range_partitioning.field == table.partitioning.column
+        assert target.range_partitioning.range_.interval == table.partitioning.interval
+        assert predicate is not None, merge
+        low, high = map(int, predicate.groups())
+        first_hour = int(f"{DAY:%Y%m%d}{HOUR:02d}")
+        assert low == high == first_hour, (low, high)
+
+        history = [DAY - datetime.timedelta(days=d) for d in range(args.history_days)]
+        history_partitions = {_partition(int(f"{d:%Y%m%d}00"), table) for d in history}
+        scanned = _partition(high, table) - _partition(low, table) + 1
+        print(
+            f"{table.bigquery_table}: partitioned by {table.partitioning.column}, "
+            f"clustered by {', '.join(table.clustering_columns)}; "
+            f"MERGE on {low}..{high} scans {scanned} of {len(history_partitions)} "
+            f"partitions of {args.history_days} days of history"
+        )
+    print("targets ok: schema, partitioning and clustering as specified")
+
+
+if __name__ == "__main__":
+    main()
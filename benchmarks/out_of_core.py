@@ -0,0 +1,85 @@
+"""
+Out-of-core publishing: DelayFact over a run database larger than the publish memory limit.
+The export runs once without a limit and once under `--memory-limit-mb`, spilling to a temp
+directory, and both have to produce the same rows.
+
+    python -m benchmarks.out_of_core --delays-per-hour 150000 --memory-limit-mb 100
+"""
+
+import argparse
+import dataclasses
+import datetime
+import os
+import tempfile
+
+from benchmarks.common import build_shards, load_time_dim, measure
+from benchmarks.generators import SCALES, write_dataset
+
+DAY = datetime.date(2024, 12, 25)
+
+
+def publish_delay_fact(run_path: str, memory_limit: str, temp_directory: str) -> int:
+    # read by src.sessions at import time
+    if memory_limit:
+        os.environ["DUCKDB_PUBLISH_MEMORY_LIMIT"] = memory_limit
+    os.environ["DUCKDB_PUBLISH_TEMP_DIRECTORY"] = temp_directory
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src.bigquery import publish_table_to_bigquery
+    from src.enums import Table
+    from src.sessions import connect_duckdb
+
+    with connect_duckdb(run_path, "publish", read_only=True) as dbsession:
+        return publish_table_to_bigquery(
+            FakeBigQueryClient(), dbsession, Table.DELAY, "project", "dataset"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delays-per-hour", type=int, default=150_000)
+    parser.add_argument("--memory-limit-mb", type=int, default=100)
+    args = parser.parse_args()
+
+    import duckdb
+
+    from src.shards import DUCKDB_SHARDS, merge_shard_databases
+
+    scale = dataclasses.replace(SCALES["city"], delays_per_hour=args.delays_per_hour)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_dataset(tmp, DAY, scale)
+        shard_paths = build_shards(os.path.join(tmp, "shards"), DAY, hour=None)
+        run_path = os.path.join(tmp, "run.duckdb")
+        with duckdb.connect(run_path) as dbsession:
+            merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS, mode="copy")
+            load_time_dim(dbsession, DAY, hour=None)
+            delays = dbsession.execute("select count(*) from delays").fetchone()[0]
+        run_mb = os.path.getsize(run_path) / 2**20
+        print(f"{delays:,} delays, run database {run_mb:.1f} MB")
+        assert run_mb > args.memory_limit_mb, "the dataset fits in the memory limit"
+
+        results = [
+            measure(
+                "no memory limit",
+                publish_delay_fact,
+                run_path,
+                "",
+                os.path.join(tmp, "spill-unlimited"),
+            ),
+            measure(
+                f"memory_limit={args.memory_limit_mb}MB",
+                publish_delay_fact,
+                run_path,
+                f"{args.memory_limit_mb}MB",
+                os.path.join(tmp, "spill"),
+            ),
+        ]
+        assert results[0].result == results[1].result, [m.result for m in results]
+        print(f"DelayFact: {results[0].result:,} rows")
+        for m in results:
+            print(m)
+
+
+if __name__ == "__main__":
+    main()
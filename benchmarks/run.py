@@ -0,0 +1,186 @@
+"""
+Run the whole pipeline on generated data and compare it against a stored baseline: every loader,
+the shard merge, every `Table` query and the publish to a stubbed BigQuery. Row counts and result
+checksums have to match the baseline exactly; wall times may not regress past the tolerance.
+Runs offline, nothing leaves the machine.
+
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale small --update-baseline
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+from typing import Dict, List
+
+from benchmarks.common import build_shards, load_time_dim
+from benchmarks.generators import SCALES, write_dataset
+
+DAY = datetime.date(2024, 12, 25)
+HOUR = 10
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def _stage_key(stage: str, labels: Dict[str, str]) -> str:
+    # staging tables are named after the work dir, only the table makes a stable key
+    return f"{stage}:{labels['table']}" if "table" in labels else stage
+
+
+def run_pipeline(root: str, scale: str, repeat: int) -> Dict[str, dict]:
+    """
+    Load, merge, query and publish one hour of `scale` generated under `root`.
+
+    :return: Wall time, rows and (for `Table` queries) a checksum of the result per stage.
+    """
+    import duckdb
+
+    from benchmarks.fakes import FakeBigQueryClient
+    from src.bigquery import publish_tables_to_bigquery
+    from src.enums import Table
+    from src.instrumentation import collected_metrics, track
+    from src.shards import DUCKDB_SHARDS, merge_shard_databases
+
+    os.chdir(root)
+    write_dataset(root, DAY, SCALES[scale])
+    shard_paths = build_shards(os.path.join(root, "shards"), DAY, HOUR)
+    with duckdb.connect(os.path.join(root, "run.duckdb")) as dbsession:
+        with track("merge_shards"):
+            merge_shard_databases(dbsession, shard_paths, DUCKDB_SHARDS)
+        load_time_dim(dbsession, DAY, HOUR)
+
+        checksums = {}
+        for table in Table:
+            # order independent, and unlike xor duplicated rows don't cancel out
+            query = f"select count(*), sum(hash(q)) from ({table.duckdb_query}) q"
+            for _ in range(repeat):
+                with track("table_query", {"table": table.bigquery_table}) as metrics:
+                    rows, checksum = dbsession.execute(query).fetchone()
+                    metrics.rows_out = rows
+            checksums[_stage_key("table_query", metrics.labels)] = str(checksum)
+
+        publish_tables_to_bigquery(
+            FakeBigQueryClient(), dbsession, list(Table), "project", "dataset"
+        )
+
+    results: Dict[str, dict] = {}
+    for m in collected_metrics():
+        key = _stage_key(m.stage, m.labels)
+        if m.stage == "table_query" and key in results:
+            # repeated queries keep their fastest run
+            results[key]["wall_s"] = min(results[key]["wall_s"], m.wall_s)
+            continue
+        result = results.setdefault(key, {"wall_s": 0.0, "rows": None})
+        result["wall_s"] += m.wall_s
+        if m.rows_out is not None:
+            result["rows"] = (result["rows"] or 0) + m.rows_out
+        if key in checksums:
+            result["checksum"] = checksums[key]
+    return results
+
+
+def compare(
+    results: Dict[str, dict],
+    baseline: Dict[str, dict],
+    tolerance: float,
+    min_delta_s: float,
+) -> List[str]:
+    """
+    :return: One message per stage whose rows or checksum differ from the baseline,
+        or whose wall time grew by more than `tolerance` and `min_delta_s`.
+    """
+    problems = []
+    for key, base in baseline.items():
+        if key not in results:
+            problems.append(f"{key}: missing from this run")
+            continue
+        result = results[key]
+        for field in ["rows", "checksum"]:
+            if base.get(field) != result.get(field):
+                problems.append(
+                    f"{key}: {field} {result.get(field)} != baseline {base.get(field)}"
+                )
+        delta_s = result["wall_s"] - base["wall_s"]
+        if delta_s > min_delta_s and delta_s > base["wall_s"] * tolerance:
+            problems.append(
+                f"{key}: {result['wall_s']:.3f}s, {delta_s:+.3f}s over baseline {base['wall_s']:.3f}s"
+            )
+    return problems
+
+
+def _environment() -> Dict[str, str]:
+    import duckdb
+
+    # checksums rely on DuckDB's hash, which may change between versions
+    return {
+        "duckdb": duckdb.__version__,
+        "python": platform.python_version(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="Baseline file, by scale by default")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-s", type=float, default=0.05)
+    args = parser.parse_args()
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.scale}.json")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_pipeline(tmp, args.scale, args.repeat)
+
+    environment = _environment()
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    for key, result in results.items():
+        line = f"{key:<32} {result['wall_s']:>9.3f}s"
+        if result["rows"] is not None:
+            line += f" {result['rows']:>11,} rows"
+        if baseline is not None and key in baseline["stages"]:
+            line += f" {result['wall_s'] - baseline['stages'][key]['wall_s']:>+9.3f}s"
+        print(line)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(
+                {"environment": environment, "stages": results},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+        print(f"baseline written to {baseline_path}")
+        return
+
+    if baseline is None:
+        sys.exit(f"No baseline at {baseline_path}, run with --update-baseline first")
+    if baseline["environment"]["duckdb"] != environment["duckdb"]:
+        print(
+            f"baseline taken with DuckDB {baseline['environment']['duckdb']}, "
+            f"checksums are not comparable"
+        )
+        for stage in baseline["stages"].values():
+            stage.pop("checksum", None)
+        for result in results.values():
+            result.pop("checksum", None)
+    problems = compare(results, baseline["stages"], args.tolerance, args.min_delta_s)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("matches baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Weather classification: row-wise `.apply` against the NumPy versions in `src.weather`.
+Parity is checked over a grid hitting every bucket boundary, then both paths are timed.
+
+    python -m benchmarks.weather --rows 1000000
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.weather import (
+    _classify_fall_type,
+    _classify_fall_types,
+    _classify_general_circumstances,
+    _classify_general_circumstances_vectorized,
+)
+
+# bucket edges and their neighbours, plus values far outside and missing humidity
+TEMPERATURES = [-30.0, 1.9, 2.0, 2.1, 9.9, 10.0, 17.0, 25.0, 25.1, 35.0, 35.1, 45.0]
+WIND_SPEEDS = [0, 4, 5, 9, 10, 15, 16, 40]
+HUMIDITIES = [0.0, 69.9, 70.0, 90.0, 90.1, 100.0, np.nan]
+PRECIPITATION = [0, 1, 5, 6, 50]
+
+
+def grid() -> pd.DataFrame:
+    return pd.DataFrame(
+        itertools.product(TEMPERATURES, WIND_SPEEDS, HUMIDITIES, PRECIPITATION),
+        columns=["temperature", "wind_speed_mps", "humidity_percent", "fall_mm"],
+    )
+
+
+def classify_rowwise(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "fall_type": df["temperature"].apply(_classify_fall_type),
+            "general_circumstances": df.apply(
+                lambda row: _classify_general_circumstances(
+                    row["temperature"],
+                    row["wind_speed_mps"],
+                    row["humidity_percent"],
+                    row["fall_mm"],
+                ),
+                axis=1,
+            ),
+        }
+    )
+
+
+def classify_vectorized(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "fall_type": _classify_fall_types(df["temperature"]),
+            "general_circumstances": _classify_general_circumstances_vectorized(
+                df["temperature"],
+                df["wind_speed_mps"],
+                df["humidity_percent"],
+                df["fall_mm"],
+            ),
+        },
+        index=df.index,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    inputs = grid()
+    expected = classify_rowwise(inputs)
+    actual = classify_vectorized(inputs)
+    mismatches = (expected != actual).any(axis=1)
+    assert not mismatches.any(), inputs[mismatches]
+    print(f"parity ok on {len(inputs):,} grid points")
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "temperature": rng.uniform(-20, 40, args.rows).round(1),
+            "wind_speed_mps": rng.integers(0, 25, args.rows),
+            "humidity_percent": rng.uniform(20, 100, args.rows).round(1),
+            "fall_mm": rng.choice([0, 0, 0, 1, 3, 8], args.rows),
+        }
+    )
+    for name, fn in [
+        ("row-wise .apply", classify_rowwise),
+        ("numpy", classify_vectorized),
+    ]:
+        start = time.perf_counter()
+        fn(df)
+        print(f"{name:<32} {time.perf_counter() - start:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
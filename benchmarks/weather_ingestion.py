@@ -0,0 +1,57 @@
+"""
+Multi-station weather loading: one synop file per station, read by DuckDB's multi-file
+`read_csv` with an increasing thread count. Checks every station keeps its own hourly series.
+
+    python -m benchmarks.weather_ingestion --stations 2000
+"""
+
+import argparse
+import dataclasses
+import datetime
+import os
+import tempfile
+
+from benchmarks.common import measure
+from benchmarks.generators import SCALES, write_weather_day
+
+DAY = datetime.date(2024, 12, 25)
+
+
+def load(root: str, threads: int) -> int:
+    # read by src.sessions at import time
+    os.environ["DUCKDB_LOAD_THREADS"] = str(threads)
+    os.chdir(root)
+
+    import pendulum
+
+    from src.sessions import connect_duckdb
+    from src.weather import load_weather_into_duckdb
+
+    with connect_duckdb(task_class="load") as dbsession:
+        load_weather_into_duckdb(pendulum.date(DAY.year, DAY.month, DAY.day), dbsession)
+        series = dbsession.execute(
+            "select count(distinct station_id), max(hours) from "
+            "(select station_id, count(*) as hours from weather group by station_id)"
+        ).fetchone()
+    assert series[1] == 24, f"a station has {series[1]} hourly rows"
+    return series[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=2_000)
+    args = parser.parse_args()
+
+    scale = dataclasses.replace(SCALES["tiny"], weather_stations=args.stations)
+    threads = sorted({1, 2, 4, os.cpu_count() or 1})
+    with tempfile.TemporaryDirectory() as tmp:
+        write_weather_day(tmp, DAY, scale)
+        print(f"{args.stations:,} station files, {os.cpu_count()} cores")
+        for n in threads:
+            m = measure(f"threads={n}", load, tmp, n)
+            assert m.result == args.stations, f"loaded {m.result} stations"
+            print(m)
+
+
+if __name__ == "__main__":
+    main()
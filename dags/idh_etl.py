@@ -1,31 +1,20 @@
+"""
+The scheduler re-parses this file constantly, so only what shapes the DAG is imported at the top.
+DuckDB, pandas and the cloud SDKs are imported by the tasks that use them; .env is read by
+src.settings.
+"""
+
 import datetime
+import functools
 import os
-import uuid
 from typing import Optional
 
-import dotenv
-import duckdb
-import pandas as pd
 from airflow.decorators import dag, task, task_group
 from airflow.utils.log.logging_mixin import LoggingMixin
-from google.cloud import bigquery
-from google.oauth2 import service_account
 from pendulum import DateTime
 
-from src.delays import load_delays_into_duckdb
 from src.enums import Table
-from src.gtfs import load_gtfs_into_duckdb, GTFS_FILES
-from src.time_utils import MONTH_MAP, get_season, get_time_of_day
-from src.vehicles import load_vehicles_into_duckdb
-from src.weather import load_weather_into_duckdb
-
-DUCKDB_SHARDS = {
-    "time": ["time_dim"],
-    "gtfs": GTFS_FILES,
-    "delays": ["delays"],
-    "vehicles": ["vehicles"],
-    "weather": ["weather"],
-}
+from src.settings import BIGQUERY_PUBLISH_MODE, DUCKDB_LOAD_MODE, PUBLISH_SINK
 
 DUCKDB_VOLUME_PATH = "/usr/local/airflow/duckdb"
 
@@ -38,6 +27,190 @@ def duckdb_path(logical_date: DateTime, shard: Optional[str] = None) -> str:
     return path
 
 
+def static_cache_dir(name: str) -> str:
+    return f"{DUCKDB_VOLUME_PATH}/cache/{name}"
+
+
+def publish_work_dir(logical_date: DateTime, table: Optional[Table] = None) -> str:
+    path = f"{DUCKDB_VOLUME_PATH}/publish/idh-{logical_date.strftime('%Y%m%d_%H%M%S')}"
+    if table is not None:
+        path = f"{path}/{table.name.lower()}"
+
+    return path
+
+
+def delays_state_path(logical_date: DateTime) -> str:
+    state_dir = f"{DUCKDB_VOLUME_PATH}/state"
+    os.makedirs(state_dir, exist_ok=True)
+    return f"{state_dir}/delays-{logical_date.strftime('%Y%m%d')}.duckdb"
+
+
+def landing_dir() -> Optional[str]:
+    from src.landing import INGESTION_MODE
+
+    if INGESTION_MODE == "landing":
+        return f"{DUCKDB_VOLUME_PATH}/landing"
+    return None
+
+
+def calendar_path() -> str:
+    return f"{DUCKDB_VOLUME_PATH}/calendar.duckdb"
+
+
+def digest_dir() -> Optional[str]:
+    from src.bigquery import BIGQUERY_DELTA_MODE
+
+    if BIGQUERY_DELTA_MODE == "digest":
+        return f"{DUCKDB_VOLUME_PATH}/digests"
+    return None
+
+
+def warehouse_path() -> str:
+    # next to the run databases, unless LOCAL_WAREHOUSE_PATH points elsewhere
+    return os.getenv("LOCAL_WAREHOUSE_PATH", f"{DUCKDB_VOLUME_PATH}/warehouse.duckdb")
+
+
+def publish_sink():
+    # built in the publishing tasks, so parsing the DAG needs no credentials
+    from src.sinks import get_sink
+
+    return get_sink(PUBLISH_SINK, warehouse_path())
+
+
+def metrics_dir(logical_date: DateTime) -> str:
+    return f"{DUCKDB_VOLUME_PATH}/metrics/idh-{logical_date.strftime('%Y%m%d_%H%M%S')}"
+
+
+def sync_from_blob_storage(bucket: str, prefix: str, local_dir: str):
+    from src.blob_storage import (
+        AZURE_STORAGE_CONNECTION_STRING,
+        get_container_client,
+        sync_blobs_to_local,
+    )
+    from src.instrumentation import track
+
+    # without a storage account the loaders read whatever is already under data/
+    if AZURE_STORAGE_CONNECTION_STRING:
+        with track("blob_sync", {"bucket": bucket, "prefix": prefix}) as metrics:
+            with get_container_client(bucket) as container_client:
+                metrics.rows_out = len(
+                    sync_blobs_to_local(container_client, prefix, local_dir)
+                )
+
+
+def load_gtfs(logical_date: DateTime, dbsession):
+    from src.gtfs import (
+        GTFS_BUCKET,
+        GTFS_LOCAL_DIR,
+        gtfs_blob_prefix,
+        load_gtfs_into_duckdb,
+    )
+
+    sync_from_blob_storage(
+        GTFS_BUCKET, gtfs_blob_prefix(logical_date.date()), GTFS_LOCAL_DIR
+    )
+    load_gtfs_into_duckdb(
+        logical_date.date(),
+        dbsession,
+        cache_dir=static_cache_dir("gtfs"),
+        landing_dir=landing_dir(),
+    )
+
+
+def load_delays(logical_date: DateTime, dbsession):
+    from src.delays import (
+        DELAYS_BUCKET,
+        DELAYS_LOCAL_DIR,
+        delays_blob_prefix,
+        load_delays_into_duckdb,
+    )
+
+    sync_from_blob_storage(
+        DELAYS_BUCKET, delays_blob_prefix(logical_date.date()), DELAYS_LOCAL_DIR
+    )
+    landing = landing_dir()
+    load_delays_into_duckdb(
+        logical_date.date(),
+        dbsession,
+        state_path=None if landing else delays_state_path(logical_date),
+        hour=logical_date.hour,
+        landing_dir=landing,
+    )
+
+
+def load_vehicles(logical_date: DateTime, dbsession):
+    from src.vehicles import load_vehicles_into_duckdb
+
+    load_vehicles_into_duckdb(
+        dbsession,
+        cache_dir=static_cache_dir("vehicles"),
+        as_of=logical_date.date(),
+    )
+
+
+def load_weather(logical_date: DateTime, dbsession):
+    from src.weather import (
+        WEATHER_BUCKET,
+        WEATHER_LOCAL_DIR,
+        load_weather_into_duckdb,
+        weather_blob_prefix,
+    )
+
+    sync_from_blob_storage(
+        WEATHER_BUCKET,
+        weather_blob_prefix(logical_date.date()),
+        WEATHER_LOCAL_DIR,
+    )
+    load_weather_into_duckdb(
+        logical_date.date(),
+        dbsession,
+        landing_dir=landing_dir(),
+    )
+
+
+def load_time_dim(logical_date: DateTime, dbsession):
+    from src.time_utils import load_time_dim_into_duckdb
+
+    load_time_dim_into_duckdb(
+        logical_date,
+        logical_date,
+        dbsession,
+        calendar_path=calendar_path(),
+    )
+
+
+# loader of each shard, they write the tables `DUCKDB_SHARDS` lists for them
+SHARD_LOADERS = {
+    "gtfs": load_gtfs,
+    "delays": load_delays,
+    "vehicles": load_vehicles,
+    "weather": load_weather,
+}
+
+
+def verify_tables(dbsession, log):
+    from src.gtfs import GTFS_TABLES
+
+    tables = [
+        *GTFS_TABLES,
+        "delays",
+        "route_vehicles",
+        "vehicles",
+        "weather",
+        "weather_stations",
+        "time_dim",
+    ]
+    show_tables = dbsession.execute("show tables").df()
+    log.info(f"Tables at verification step: {show_tables}")
+    for t in tables:
+        log.info(f"Verifying table: {t}")
+        try:
+            dbsession.execute(f"select * from {t} limit 1").df()
+            log.info(f"Successfully queried table: {t}")
+        except Exception as e:
+            log.error(f"Failed to query table: {t} - {e}")
+
+
 DEFAULT_ARGS = {
     "retries": 3,
     "retry_delay": datetime.timedelta(seconds=30),
@@ -53,223 +226,146 @@ DEFAULT_ARGS = {
     default_args=DEFAULT_ARGS,
 )
 def idh_etl():
-    dotenv.load_dotenv()
-    gcp_credentials_file = "gcp-credentials.json"
-    bigquery_project_id = os.getenv("BIGQUERY_PROJECT_ID")
-    dataset_id = os.getenv("DATASET_ID")
-
     log = LoggingMixin().log
 
-    bigquery_client = bigquery.Client(
-        credentials=service_account.Credentials.from_service_account_file(
-            filename=gcp_credentials_file,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        ),
-        project=bigquery_project_id,
-    )
-
     @task_group
     def load_duckdb():
-        @task
-        def time(logical_date: DateTime):
-            df = pd.DataFrame(
-                {
-                    "id": [int(logical_date.strftime("%Y%m%d"))],
-                    "full_timestamp": [pd.to_datetime(logical_date)],
-                    "hour_": [logical_date.hour],
-                    "weekday": [logical_date.day_of_week.name],
-                    "weekday_num": [logical_date.weekday() + 1],
-                    "month_": [MONTH_MAP[logical_date.month]],
-                    "month_num": [logical_date.month],
-                    "season": [get_season(logical_date.month).value],
-                    "year_": [logical_date.year],
-                    "time_of_day": [get_time_of_day(logical_date.hour).value],
-                    "is_business_day": [logical_date.weekday() < 5],
-                }
-            )
-
-            db_path = duckdb_path(logical_date, "time")
-            with duckdb.connect(db_path) as dbsession:
-                tmp_view_name = "_tmp_time"
-                dbsession.register(tmp_view_name, df)
-                dbsession.execute("drop table if exists time_dim")
-                dbsession.execute(
-                    f"create table time_dim as select * from {tmp_view_name}"
-                )
-                dbsession.unregister(tmp_view_name)
+        def load_shard(shard: str, logical_date: DateTime):
+            from src.instrumentation import write_metrics
+            from src.sessions import connect_duckdb
+
+            # failed stages are recorded too
+            try:
+                with connect_duckdb(
+                    duckdb_path(logical_date, shard), "load"
+                ) as dbsession:
+                    SHARD_LOADERS[shard](logical_date, dbsession)
+            finally:
+                write_metrics(metrics_dir(logical_date), shard)
+            log.info(f"{shard.upper()} loaded into DuckDB")
 
         @task
         def gtfs(logical_date: DateTime):
-            db_path = duckdb_path(logical_date, "gtfs")
-            with duckdb.connect(db_path) as dbsession:
-                load_gtfs_into_duckdb(
-                    logical_date,
-                    dbsession,
-                )
-            log.info("GTFS loaded into DuckDB")
+            load_shard("gtfs", logical_date)
 
         @task
         def delays(logical_date: DateTime):
-            db_path = duckdb_path(logical_date, "delays")
-            with duckdb.connect(db_path) as dbsession:
-                load_delays_into_duckdb(
-                    logical_date.date(),
-                    dbsession,
-                )
-            log.info("DELAYS loaded into DuckDB")
+            load_shard("delays", logical_date)
 
         @task
         def vehicles(logical_date: DateTime):
-            db_path = duckdb_path(logical_date, "vehicles")
-            with duckdb.connect(db_path) as dbsession:
-                load_vehicles_into_duckdb(dbsession)
-            log.info("VEHICLES loaded into DuckDB")
+            load_shard("vehicles", logical_date)
 
         @task
         def weather(logical_date: DateTime):
-            db_path = duckdb_path(logical_date, "weather")
-            with duckdb.connect(db_path) as dbsession:
-                load_weather_into_duckdb(
-                    logical_date.date(),
-                    dbsession,
-                )
-            log.info("WEATHER loaded into DuckDB")
+            load_shard("weather", logical_date)
 
         @task
         def merge_shards(logical_date: DateTime):
-            target_path = duckdb_path(logical_date)
-            with duckdb.connect(target_path) as dbsession:
-                for shard_name, tables in DUCKDB_SHARDS.items():
-                    log.info(f"Merging shard: {shard_name}")
-                    shard_path = duckdb_path(logical_date, shard_name)
-                    if not os.path.exists(shard_path):
-                        log.warning(
-                            f"Shard path does not exist: {shard_path}, skipping"
-                        )
-                        continue
-                    shard_alias = f"shard_{shard_name}"
-                    dbsession.execute(
-                        f"attach database '{shard_path}' as {shard_alias}"
-                    )
+            from src.instrumentation import write_metrics
+            from src.sessions import connect_duckdb
+            from src.shards import DUCKDB_SHARDS, merge_shard_databases
 
-                    for t in tables:
-                        dbsession.execute(
-                            f"create or replace table {t} as select * from {shard_alias}.{t}"
-                        )
-
-                    dbsession.execute(f"detach database {shard_alias}")
-                    os.remove(shard_path)
-                    log.info(
-                        f"Successfully merged {shard_alias} and removed {shard_path}"
+            try:
+                with connect_duckdb(duckdb_path(logical_date), "merge") as dbsession:
+                    merge_shard_databases(
+                        dbsession,
+                        {s: duckdb_path(logical_date, s) for s in DUCKDB_SHARDS},
+                        DUCKDB_SHARDS,
                     )
+                    load_time_dim(logical_date, dbsession)
+            finally:
+                write_metrics(metrics_dir(logical_date), "merge_shards")
 
         @task
         def verify(logical_date: DateTime):
-            tables = [*GTFS_FILES, "delays", "vehicles", "weather", "time_dim"]
-            with duckdb.connect(duckdb_path(logical_date)) as dbsession:
-                show_tables = dbsession.execute("show tables").df()
-                log.info(f"Tables at verification step: {show_tables}")
-                for t in tables:
-                    log.info(f"Verifying table: {t}")
-                    try:
-                        dbsession.execute(f"select * from {t} limit 1").df()
-                        log.info(f"Successfully queried table: {t}")
-                    except Exception as e:
-                        log.error(f"Failed to query table: {t} - {e}")
-
-        [time(), gtfs(), delays(), vehicles(), weather()] >> merge_shards() >> verify()
+            from src.sessions import connect_duckdb
+            from src.shards import attach_shards
+
+            with connect_duckdb(duckdb_path(logical_date), "merge") as dbsession:
+                attach_shards(dbsession)
+                verify_tables(dbsession, log)
+
+        [gtfs(), delays(), vehicles(), weather()] >> merge_shards() >> verify()
+
+    @task
+    def load_run(logical_date: DateTime):
+        # every loader and time_dim at once, straight into the run database
+        from src.instrumentation import track, write_metrics
+        from src.sessions import connect_duckdb
+        from src.shards import load_concurrently
+
+        loaders = {**SHARD_LOADERS, "time_dim": load_time_dim}
+        try:
+            with connect_duckdb(duckdb_path(logical_date), "load") as dbsession:
+                with track("load_run", {"hour": logical_date}):
+                    load_concurrently(
+                        dbsession,
+                        {
+                            name: functools.partial(loader, logical_date)
+                            for name, loader in loaders.items()
+                        },
+                    )
+                verify_tables(dbsession, log)
+        finally:
+            write_metrics(metrics_dir(logical_date), "load_run")
+        log.info("All sources loaded into DuckDB")
 
     @task
     def write_table_to_bigquery(
         table: Table,
         logical_date: DateTime,
     ):
-        log.info(f"Writing {table.bigquery_table} to BigQuery")
-        with duckdb.connect(duckdb_path(logical_date), read_only=True) as dbsession:
-            df = dbsession.execute(table.duckdb_query).df()
-            log.info(f"Fetched {len(df)} rows from DuckDB for {table.bigquery_table}")
-
-            if df.empty:
-                log.info("No rows to upload; exiting")
-                return
-
-            key_columns = table.unique_key_columns or []
-            if not key_columns:
-                log.warning(
-                    f"No unique_key_columns defined for {table.bigquery_table}; skipping write to avoid duplicates"
-                )
-                return
-
-            # remove duplicated column names if any
-            df = df.loc[:, ~df.columns.duplicated()]
-
-            # ensure all key columns exist in the dataframe
-            missing_keys = [k for k in key_columns if k not in df.columns]
-            if missing_keys:
-                log.warning(
-                    f"Unique key columns {missing_keys} not present in query results for {table.bigquery_table}; skipping write to avoid duplicates"
-                )
-                return
-
-            # drop duplicate rows based on the unique key columns
-            before = len(df)
-            df = df.drop_duplicates(subset=key_columns)
-            removed = before - len(df)
-            if removed > 0:
-                log.info(
-                    f"Removed {removed} duplicate rows based on keys {key_columns} for {table.bigquery_table}"
+        from src.instrumentation import write_metrics
+        from src.sessions import connect_duckdb
+        from src.shards import attach_shards
+
+        log.info(f"Writing {table.bigquery_table} to the {PUBLISH_SINK} sink")
+        sink = publish_sink()
+        try:
+            with connect_duckdb(
+                duckdb_path(logical_date), "publish", read_only=True
+            ) as dbsession:
+                attach_shards(dbsession)
+                sink.publish_table(
+                    dbsession,
+                    table,
+                    work_dir=publish_work_dir(logical_date, table),
+                    digest_dir=digest_dir(),
                 )
+        finally:
+            write_metrics(metrics_dir(logical_date), f"publish_{table.name.lower()}")
+        log.info(f"Successfully written new rows to {table.bigquery_table}")
 
-            if df.empty:
-                log.info("All rows were duplicates after deduplication; exiting")
-                return
-
-            staging_table = f"{table.bigquery_table}_staging_{uuid.uuid4().hex[:8]}"
-            staging_table_id = f"{bigquery_project_id}.{dataset_id}.{staging_table}"
-
-            job_config = bigquery.LoadJobConfig(
-                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-                create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
-            )
-
-            try:
-                load_job = bigquery_client.load_table_from_dataframe(
-                    df, staging_table_id, job_config=job_config
-                )
-                load_job.result()
-                log.info(f"Loaded {len(df)} rows into staging table {staging_table_id}")
-
-                on_clause = " AND ".join([f"T.`{c}` = S.`{c}`" for c in key_columns])
-                cols = [c for c in df.columns]
-                cols_escaped = ", ".join([f"`{c}`" for c in cols])
-                values = ", ".join([f"S.`{c}`" for c in cols])
-
-                merge_sql = f"""
-                MERGE `{bigquery_project_id}.{dataset_id}.{table.bigquery_table}` T
-                USING `{bigquery_project_id}.{dataset_id}.{staging_table}` S
-                ON {on_clause}
-                WHEN NOT MATCHED BY TARGET THEN
-                  INSERT ({cols_escaped}) VALUES ({values})
-                """
-
-                query_job = bigquery_client.query(merge_sql)
-                query_job.result()
-                log.info(
-                    f"MERGE completed into {table.bigquery_table} from staging {staging_table}"
+    @task
+    def write_tables_to_bigquery(logical_date: DateTime):
+        from src.instrumentation import write_metrics
+        from src.sessions import connect_duckdb
+        from src.shards import attach_shards
+
+        log.info(f"Writing all tables to the {PUBLISH_SINK} sink in one transaction")
+        sink = publish_sink()
+        try:
+            with connect_duckdb(
+                duckdb_path(logical_date), "publish", read_only=True
+            ) as dbsession:
+                attach_shards(dbsession)
+                rows = sink.publish_tables(
+                    dbsession,
+                    list(Table),
+                    work_dir=publish_work_dir(logical_date),
+                    digest_dir=digest_dir(),
                 )
-
-            finally:
-                try:
-                    bigquery_client.delete_table(staging_table_id, not_found_ok=True)
-                    log.info(f"Removed staging table {staging_table_id}")
-                except Exception as e:
-                    log.warning(
-                        f"Failed to remove staging table {staging_table_id}: {e}"
-                    )
-
-        log.info(f"Successfully written new rows to {table.bigquery_table} in BigQuery")
-
-    load_duckdb() >> write_table_to_bigquery.expand(table=list(Table))
+        finally:
+            write_metrics(metrics_dir(logical_date), "publish")
+        for table, table_rows in rows.items():
+            log.info(f"Uploaded {table_rows} rows for {table.bigquery_table}")
+
+    load = load_run() if DUCKDB_LOAD_MODE == "consolidated" else load_duckdb()
+    if BIGQUERY_PUBLISH_MODE == "batched":
+        load >> write_tables_to_bigquery()
+    else:
+        load >> write_table_to_bigquery.expand(table=list(Table))
 
 
 idh_etl()
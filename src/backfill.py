@@ -0,0 +1,202 @@
+"""
+Backfill a date range in one DuckDB database instead of one DAG run per hour.
+
+    python -m src.backfill 2024-12-01 2024-12-31 --database backfill.duckdb --publish
+    python -m src.backfill 2024-12-01 2024-12-31 --publish --sink local
+"""
+
+import argparse
+import logging
+import time
+from typing import Dict, List, Optional
+
+import duckdb
+import pendulum
+
+from src.delays import load_delays_range_into_duckdb
+from src.enums import Table
+from src.gtfs import load_gtfs_into_duckdb
+from src.ingestion import configure_session
+from src.instrumentation import write_metrics
+from src.sessions import connect_duckdb
+from src.settings import PUBLISH_SINK, PUBLISH_SINKS
+from src.time_utils import load_time_dim_into_duckdb
+from src.vehicles import load_vehicles_into_duckdb
+from src.weather import load_weather_into_duckdb
+
+# tables loaded once per day, with the column identifying a row across days;
+# when several days carry the same row, the latest day's version is kept
+BACKFILL_DAILY_TABLES = {
+    "routes": "route_id",
+    "stops": "stop_id",
+    "trip_stats": "trip_id",
+    "weather": "id",
+    "weather_stations": "station_id",
+}
+
+log = logging.getLogger(__name__)
+
+
+def _days(start: pendulum.Date, end: pendulum.Date) -> List[pendulum.Date]:
+    return [start.add(days=i) for i in range((end - start).days + 1)]
+
+
+def _cache_subdir(cache_dir: Optional[str], name: str) -> Optional[str]:
+    return None if cache_dir is None else f"{cache_dir}/{name}"
+
+
+def _append_day(
+    dbsession: duckdb.DuckDBPyConnection,
+    catalog: str,
+    day_catalog: str,
+    day: pendulum.Date,
+    tables: List[str],
+):
+    for t in tables:
+        day_rows = f"select *, cast(? as date) as _as_of from {day_catalog}.{t}"
+        dbsession.execute(
+            f"create table if not exists {catalog}.{t} as {day_rows} limit 0", [day]
+        )
+        dbsession.execute(f"insert into {catalog}.{t} by name {day_rows}", [day])
+
+
+def backfill_into_duckdb(
+    start: pendulum.Date,
+    end: pendulum.Date,
+    dbsession: duckdb.DuckDBPyConnection,
+    cache_dir: Optional[str] = None,
+    landing_dir: Optional[str] = None,
+) -> int:
+    """
+    Load every day from `start` to `end` (inclusive) into the database `dbsession` is
+    connected to, with the tables the `Table` queries need, so dimensions and facts of
+    the whole range are computed by one query each.
+
+    Delays of the range are read with a single scan. GTFS and weather are loaded day by day
+    into a scratch catalog and appended; days missing an input are skipped with a warning.
+
+    :param start: First day.
+    :param end: Last day.
+    :param dbsession: Session on the backfill database.
+    :param cache_dir: Directory of the static caches, one subdirectory per loader.
+    :param landing_dir: Landing zone to read raw inputs through.
+    :return: Number of delay rows loaded.
+    """
+    configure_session(dbsession)
+    catalog = dbsession.execute("select current_database()").fetchone()[0]
+    days = _days(start, end)
+    for t in BACKFILL_DAILY_TABLES:
+        dbsession.execute(f"drop table if exists {t}")
+
+    day_catalog = "backfill_day"
+    dbsession.execute(f"attach ':memory:' as {day_catalog}")
+    try:
+        for day in days:
+            dbsession.execute(f"use {day_catalog}")
+            loaded = []
+            try:
+                load_gtfs_into_duckdb(
+                    day,
+                    dbsession,
+                    cache_dir=_cache_subdir(cache_dir, "gtfs"),
+                    landing_dir=landing_dir,
+                )
+                loaded += ["routes", "stops", "trip_stats"]
+            except (FileNotFoundError, duckdb.IOException) as e:
+                log.warning(f"No GTFS feed for {day}, skipping it: {e}")
+            try:
+                load_weather_into_duckdb(day, dbsession, landing_dir=landing_dir)
+                loaded += ["weather", "weather_stations"]
+            except FileNotFoundError as e:
+                log.warning(f"No weather for {day}, skipping it: {e}")
+            dbsession.execute(f"use {catalog}")
+            _append_day(dbsession, catalog, day_catalog, day, loaded)
+            log.info(f"Loaded {day}")
+    finally:
+        dbsession.execute(f"use {catalog}")
+        dbsession.execute(f"detach {day_catalog}")
+
+    for t, key in BACKFILL_DAILY_TABLES.items():
+        dbsession.execute(f"""
+            create or replace table {t} as
+            select * exclude (_as_of) from {t}
+            qualify row_number() over (partition by {key} order by _as_of desc) = 1
+            """)
+
+    load_vehicles_into_duckdb(
+        dbsession, cache_dir=_cache_subdir(cache_dir, "vehicles"), as_of=end
+    )
+    load_delays_range_into_duckdb(days, dbsession, landing_dir=landing_dir)
+    load_time_dim_into_duckdb(
+        pendulum.datetime(start.year, start.month, start.day),
+        pendulum.datetime(end.year, end.month, end.day, 23),
+        dbsession,
+    )
+    return dbsession.execute("select count(*) from delays").fetchone()[0]
+
+
+def count_table_rows(dbsession: duckdb.DuckDBPyConnection) -> Dict[Table, int]:
+    return {
+        table: dbsession.execute(
+            f"select count(*) from ({table.duckdb_query})"
+        ).fetchone()[0]
+        for table in Table
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("start", type=pendulum.parse)
+    parser.add_argument("end", type=pendulum.parse)
+    parser.add_argument("--database", default="backfill.duckdb")
+    parser.add_argument("--cache-dir")
+    parser.add_argument("--landing-dir")
+    parser.add_argument(
+        "--publish", action="store_true", help="MERGE every table into the sink"
+    )
+    parser.add_argument("--sink", choices=PUBLISH_SINKS, default=PUBLISH_SINK)
+    parser.add_argument("--work-dir", help="Resumable publish work directory")
+    parser.add_argument("--metrics-dir", help="Write the stage metrics of the run here")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start_time = time.perf_counter()
+    try:
+        with connect_duckdb(args.database, "backfill") as dbsession:
+            delay_rows = backfill_into_duckdb(
+                args.start.date(),
+                args.end.date(),
+                dbsession,
+                cache_dir=args.cache_dir,
+                landing_dir=args.landing_dir,
+            )
+            load_seconds = time.perf_counter() - start_time
+            log.info(
+                f"Loaded {delay_rows:,} delays in {load_seconds:.1f}s, "
+                f"{delay_rows / load_seconds:,.0f} rows/s"
+            )
+
+            if args.publish:
+                from src.sinks import get_sink
+
+                rows = get_sink(args.sink).publish_tables(
+                    dbsession, list(Table), work_dir=args.work_dir
+                )
+            else:
+                rows = count_table_rows(dbsession)
+    finally:
+        # failed stages are recorded too
+        if args.metrics_dir:
+            write_metrics(args.metrics_dir, "backfill")
+
+    total_seconds = time.perf_counter() - start_time
+    for table, table_rows in rows.items():
+        log.info(f"{table.bigquery_table}: {table_rows:,} rows")
+    log.info(
+        f"Backfilled {args.start.date()} to {args.end.date()} in {total_seconds:.1f}s, "
+        f"{delay_rows / total_seconds:,.0f} delay rows/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
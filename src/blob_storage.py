@@ -1,10 +1,49 @@
-import io
-from typing import Iterator, Set
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 
 import pandas as pd
-import pendulum
 from azure.storage.blob import ContainerClient
 
+from src.files import read_json, write_json
+
+# parallel ranged requests per blob, and blobs downloaded at once when syncing a prefix
+BLOB_MAX_CONCURRENCY = int(os.getenv("BLOB_MAX_CONCURRENCY", "4"))
+# works for Azurite too, e.g. "UseDevelopmentStorage=true"
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+
+log = logging.getLogger(__name__)
+
+
+def get_container_client(container_name: str) -> ContainerClient:
+    return ContainerClient.from_connection_string(
+        AZURE_STORAGE_CONNECTION_STRING, container_name
+    )
+
+
+def download_blob_into(
+    container_client: ContainerClient,
+    blob_name: str,
+    stream: BinaryIO,
+    max_concurrency: int = BLOB_MAX_CONCURRENCY,
+) -> int:
+    """
+    Stream a blob into a binary file object, fetching byte ranges concurrently.
+    Only the chunks in flight are held in memory, never the whole blob.
+
+    :param container_client: Client pointing to the desired container (bucket).
+    :param blob_name: Name of the blob to download.
+    :param stream: Writable binary file object.
+    :param max_concurrency: Number of ranges downloaded in parallel.
+    :return: Number of bytes written.
+    """
+    with container_client.get_blob_client(blob_name) as blob_client:
+        return blob_client.download_blob(max_concurrency=max_concurrency).readinto(
+            stream
+        )
+
 
 def get_csv_as_df(container_client: ContainerClient, blob_name: str) -> pd.DataFrame:
     """
@@ -15,30 +54,116 @@ def get_csv_as_df(container_client: ContainerClient, blob_name: str) -> pd.DataF
     :param blob_name: Name of the blob to download.
     :return: DataFrame containing the csv data.
     """
-    with container_client.get_blob_client(blob_name) as blob_client:
-        data = blob_client.download_blob().readall()
-        return pd.read_csv(io.StringIO(data.decode()))
+    # spooled through a temporary file, so the parser reads bytes incrementally
+    # instead of the whole payload plus its decoded copy sitting in memory
+    with tempfile.TemporaryFile() as f:
+        download_blob_into(container_client, blob_name, f)
+        f.seek(0)
+        return pd.read_csv(f)
+
+
+def _download_if_changed(
+    container_client: ContainerClient, blob, local_path: str
+) -> bool:
+    mtime = blob.last_modified.timestamp()
+    if os.path.exists(local_path):
+        stat = os.stat(local_path)
+        if stat.st_size == blob.size and stat.st_mtime == mtime:
+            return False
 
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    tmp_path = f"{local_path}.part"
+    with open(tmp_path, "wb") as f:
+        download_blob_into(container_client, blob.name, f)
+    # keep the blob's timestamp, so unchanged blobs look unchanged to incremental loaders too
+    os.utime(tmp_path, (mtime, mtime))
+    os.replace(tmp_path, local_path)
+    return True
 
-def date_prefixes_for_container(container_client: ContainerClient) -> Iterator[str]:
+
+def sync_blobs_to_local(
+    container_client: ContainerClient,
+    prefix: str,
+    local_dir: str,
+    max_concurrency: int = BLOB_MAX_CONCURRENCY,
+) -> List[str]:
+    """
+    Mirror the blobs under `prefix` into `local_dir`, keeping their names as relative paths.
+    Files whose size and modification time match the blob are left alone.
+
+    :param container_client: Client pointing to the desired container (bucket).
+    :param prefix: Blob name prefix to sync, e.g. a day's "YYYY/MM/DD/".
+    :param local_dir: Directory the loaders read the container's files from.
+    :param max_concurrency: Number of blobs downloaded in parallel.
+    :return: Local paths of all blobs under `prefix`.
+    """
+    blobs = list(container_client.list_blobs(name_starts_with=prefix))
+    local_paths = [os.path.join(local_dir, blob.name) for blob in blobs]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        downloaded = sum(
+            pool.map(
+                lambda args: _download_if_changed(container_client, *args),
+                zip(blobs, local_paths),
+            )
+        )
+    log.info(
+        f"Synced {prefix} into {local_dir}: downloaded {downloaded} of {len(blobs)} blobs"
+    )
+    return local_paths
+
+
+def _numeric_child_prefixes(
+    container_client: ContainerClient, prefix: str
+) -> List[Tuple[int, str]]:
+    # one level of the virtual directory tree, listed server side with a delimiter
+    children = []
+    for item in container_client.walk_blobs(name_starts_with=prefix, delimiter="/"):
+        part = item.name[len(prefix) :].rstrip("/")
+        if item.name.endswith("/") and part.isdigit():
+            children.append((int(part), item.name))
+    return children
+
+
+def date_prefixes_for_container(
+    container_client: ContainerClient, index_path: Optional[str] = None
+) -> Iterator[str]:
     """
     Deterministic iterator that yields date prefixes in chronological order (YYYY/MM/DD).
-    It scans blob names, extracts the first three path components, deduplicates them
-    and yields them sorted by parsed date.
-    """
-    prefixes: Set[str] = set()
-
-    for blob in container_client.list_blobs():
-        parts = blob.name.split("/")
-        if (
-            len(parts) >= 3
-            and parts[0].isdigit()
-            and parts[1].isdigit()
-            and parts[2].isdigit()
+    It walks the year, month and day levels of the container with a delimiter,
+    so only prefixes are listed, never the blobs under them.
+
+    With `index_path`, the prefixes found are persisted and the next call only lists
+    from the month of the latest known day onwards; days before it are taken as complete.
+
+    :param container_client: Client pointing to the desired container (bucket).
+    :param index_path: Json file keeping the prefixes found so far.
+    """
+    prefixes = set(
+        read_json(index_path, {"prefixes": []})["prefixes"] if index_path else []
+    )
+    checkpoint = max(prefixes, default=None)
+    last_year, last_month = (
+        (int(checkpoint[:4]), int(checkpoint[5:7])) if checkpoint else (0, 0)
+    )
+
+    for year, year_prefix in _numeric_child_prefixes(container_client, ""):
+        if year < last_year:
+            continue
+        for month, month_prefix in _numeric_child_prefixes(
+            container_client, year_prefix
         ):
-            # normalize zero-padding
-            prefix = f"{parts[0]}/{parts[1].zfill(2)}/{parts[2].zfill(2)}"
-            prefixes.add(prefix)
+            if (year, month) < (last_year, last_month):
+                continue
+            for day, _ in _numeric_child_prefixes(container_client, month_prefix):
+                # normalize zero-padding
+                prefixes.add(f"{year:04d}/{month:02d}/{day:02d}")
+
+    if index_path is not None:
+        write_json(index_path, {"prefixes": sorted(prefixes)})
+        log.info(
+            f"Prefix index {index_path}: {len(prefixes)} days, listed from {checkpoint or 'the start'}"
+        )
 
-    for prefix in sorted(prefixes, key=lambda s: pendulum.from_format(s, "YYYY/MM/DD")):
+    # zero-padded, so string order is chronological order
+    for prefix in sorted(prefixes):
         yield prefix
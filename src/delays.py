@@ -1,54 +1,371 @@
+import hashlib
+import logging
 import os
-from typing import List
+from typing import List, Optional
 
 import duckdb
 import pandas as pd
 import pendulum
 
+from src.files import file_stats
+from src.ingestion import (
+    quote_literal,
+    configure_session,
+    read_csv_sql,
+    surrogate_key_sql,
+    SURROGATE_KEY_VERSION,
+)
+from src.instrumentation import instrumented_loader
+from src.landing import land_files, read_landed_sql
+from src.locking import file_lock
+
 DELAYS_BUCKET = "traffic"
+DELAYS_LOCAL_DIR = "data/delays"
+DELAYS_COLUMN_TYPES = {
+    "Timestamp": "VARCHAR",
+    "Route": "VARCHAR",
+    "Vehicle No": "VARCHAR",
+    "Stop Name": "VARCHAR",
+    "Delay": "VARCHAR",
+}
+
+# "N min" is a late arrival, "N min przed czasem" (ahead of schedule) an early one
+DELAY_MINUTES_SQL = """
+(case when contains("Delay", 'min przed czasem') then -1 else 1 end)
+* cast(replace(replace("Delay", ' min przed czasem', ''), ' min', '') as bigint)
+"""
+
+# minutes part of the offset, signed, e.g. -30 for -05:30; 0 without one or for whole hours
+OFFSET_MINUTES_SQL = """
+to_minutes(coalesce(cast(nullif(
+    regexp_extract("Timestamp", '([+-])\\d{2}:?(\\d{2})$', 1)
+    || regexp_extract("Timestamp", '([+-])\\d{2}:?(\\d{2})$', 2),
+    ''
+) as integer), 0))
+"""
+
+# we use hourly granularity, truncating rest of the timestamp to be joinable to TimeDim timestamps;
+# timestamps without an offset are UTC, same as pendulum.parse treats them. Like pandas' floor,
+# hours are cut in the timestamp's own offset, which only differs from UTC for offsets like +05:30
+TIMESTAMP_HOUR_SQL = f"""
+timezone('UTC', date_trunc('hour', timezone('UTC',
+    case
+        when regexp_matches("Timestamp", '(Z|[+-]\\d{{2}}(:?\\d{{2}})?)$')
+            then cast("Timestamp" as timestamptz)
+        else timezone('UTC', cast("Timestamp" as timestamp))
+    end
+) + {OFFSET_MINUTES_SQL}) - {OFFSET_MINUTES_SQL})
+"""
+
+# same keys as the vehicles, routes and stops tables carry, see src.vehicles and src.gtfs
+DELAYS_KEY_COLUMNS = {
+    "route_key": '"Route"',
+    "vehicle_key": '"Vehicle No"',
+    "stop_name_key": '"Stop Name"',
+}
+DELAYS_KEYS_SQL = ", ".join(
+    f"{surrogate_key_sql(source)} as {key}"
+    for key, source in DELAYS_KEY_COLUMNS.items()
+)
+
+# persisted delays are parsed again once anything producing them changes, the keys included
+DELAYS_FINGERPRINT = hashlib.sha1(
+    f"{SURROGATE_KEY_VERSION}{DELAYS_COLUMN_TYPES}{DELAY_MINUTES_SQL}{TIMESTAMP_HOUR_SQL}{DELAYS_KEYS_SQL}".encode()
+).hexdigest()[:12]
+
+log = logging.getLogger(__name__)
+
+
+def delays_blob_prefix(as_of: pendulum.Date) -> str:
+    return as_of.strftime("%Y/%m/%d/")
+
+
+def _delays_day_dir(as_of: pendulum.Date) -> str:
+    return f"{DELAYS_LOCAL_DIR}/{delays_blob_prefix(as_of)}"
 
 
 def _get_delay_files(
     as_of: pendulum.Date,
 ) -> List[str]:
-    prefix = as_of.strftime("%Y/%m/%d")
-    files = [f for f in os.listdir(f"data/delays/{prefix}/") if f.endswith(".csv")]
-    return [os.path.join(f"data/delays/{prefix}/", f) for f in files]
+    day_dir = _delays_day_dir(as_of)
+    files = [f for f in os.listdir(day_dir) if f.endswith(".csv")]
+    return [os.path.join(day_dir, f) for f in files]
 
 
-def _merge_delay_files(
-    as_of: pendulum.Date,
-) -> pd.DataFrame:
-    files = _get_delay_files(as_of)
-    dfs = [pd.read_csv(f) for f in files]
-    return pd.DataFrame() if not dfs else pd.concat(dfs)
+def _normalized_delays_sql(files: List[str], source_file: bool = False) -> str:
+    if source_file:
+        return f"""
+        select * exclude (filename) replace (
+            {DELAY_MINUTES_SQL} as "Delay",
+            {TIMESTAMP_HOUR_SQL} as "Timestamp"
+        ), {DELAYS_KEYS_SQL}, filename as source_file
+        from {read_csv_sql(files, DELAYS_COLUMN_TYPES, filename=True, sniff=False)}
+        """
+
+    return f"""
+    select * replace (
+        {DELAY_MINUTES_SQL} as "Delay",
+        {TIMESTAMP_HOUR_SQL} as "Timestamp"
+    ), {DELAYS_KEYS_SQL}
+    from {read_csv_sql(files, DELAYS_COLUMN_TYPES, sniff=False)}
+    """
 
 
+# row-wise reference implementations of the SQL above, for the parity checks in benchmarks and tests
 def _normalize_delay(delay_str: str) -> int:
     sign = -1 if "min przed czasem" in delay_str else 1
     cleaned_str = delay_str.replace(" min przed czasem", "").replace(" min", "")
     return sign * int(cleaned_str)
 
 
-# we use hourly granularity, truncating rest of the timestamp to be joinable to TimeDim timestamps
 def _normalize_timestamp(timestamp_str: str) -> pd.Timestamp:
     dt = pendulum.parse(timestamp_str)
     return pd.Timestamp(dt).floor("h")
 
 
+def _sync_delays_state(
+    as_of: pendulum.Date,
+    dbsession: duckdb.DuckDBPyConnection,
+    state_alias: str,
+):
+    files = file_stats(_get_delay_files(as_of))
+    dbsession.execute(f"""
+        create table if not exists {state_alias}.manifest (
+            file_name varchar primary key,
+            size bigint,
+            mtime double
+        )
+        """)
+    dbsession.execute(
+        f"create table if not exists {state_alias}.fingerprint (fingerprint varchar)"
+    )
+    (fingerprint,) = dbsession.execute(
+        f"select max(fingerprint) from {state_alias}.fingerprint"
+    ).fetchone()
+    ingested = {
+        file_name: (size, mtime)
+        for file_name, size, mtime in dbsession.execute(
+            f"select file_name, size, mtime from {state_alias}.manifest"
+        ).fetchall()
+    }
+    # new, rewritten or deleted files; rows of the latter two get replaced
+    stale = [f for f in ingested if files.get(f) != ingested[f]]
+    new = [f for f in files if ingested.get(f) != files[f]]
+    state_columns = {
+        c
+        for (c,) in dbsession.execute(
+            "select column_name from duckdb_columns() where database_name = ? and table_name = 'delays'",
+            [state_alias],
+        ).fetchall()
+    }
+    state_exists = bool(state_columns)
+    if state_exists and fingerprint != DELAYS_FINGERPRINT:
+        # state parsed by another DuckDB version or other SQL, its keys may not join; parse everything again
+        log.info(
+            f"Delays state parsed as {fingerprint}, parsing again as {DELAYS_FINGERPRINT}"
+        )
+        dbsession.execute(f"drop table {state_alias}.delays")
+        dbsession.execute(f"delete from {state_alias}.manifest")
+        state_exists, stale, new = False, [], list(files)
+    if state_exists and not stale and not new:
+        return
+
+    dbsession.execute("begin transaction")
+    try:
+        if not state_exists:
+            dbsession.execute(
+                f"create table {state_alias}.delays as {_normalized_delays_sql(new, source_file=True)}"
+            )
+        else:
+            if stale:
+                stale_list = ", ".join(quote_literal(f) for f in stale)
+                dbsession.execute(
+                    f"delete from {state_alias}.delays where source_file in ({stale_list})"
+                )
+                dbsession.execute(
+                    f"delete from {state_alias}.manifest where file_name in ({stale_list})"
+                )
+            if new:
+                dbsession.execute(
+                    f"insert into {state_alias}.delays by name {_normalized_delays_sql(new, source_file=True)}"
+                )
+        if new:
+            dbsession.executemany(
+                f"insert into {state_alias}.manifest values (?, ?, ?)",
+                [[f, *files[f]] for f in new],
+            )
+        dbsession.execute(f"delete from {state_alias}.fingerprint")
+        dbsession.execute(
+            f"insert into {state_alias}.fingerprint values (?)", [DELAYS_FINGERPRINT]
+        )
+        dbsession.execute("commit")
+    except BaseException:
+        dbsession.execute("rollback")
+        raise
+
+
+def _land_delays(
+    as_of: pendulum.Date,
+    dbsession: duckdb.DuckDBPyConnection,
+    landing_dir: str,
+) -> str:
+    dataset_dir = f"{landing_dir}/delays"
+    # one batch per hourly file; rows are partitioned by the day folder they came from,
+    # so a day reads back exactly what the csv path would have parsed
+    land_files(
+        dbsession,
+        dataset_dir,
+        {f: [f] for f in _get_delay_files(as_of)},
+        lambda files: f"""
+        select *,
+            {quote_literal(as_of.isoformat())} as day,
+            hour(timezone('UTC', "Timestamp")) as hour
+        from ({_normalized_delays_sql(files)})
+        """,
+        ["day", "hour"],
+        scope_dir=_delays_day_dir(as_of),
+        fingerprint=DELAYS_FINGERPRINT,
+    )
+    return dataset_dir
+
+
+def _create_route_vehicles(
+    dbsession: duckdb.DuckDBPyConnection, delays_sql: str, params: Optional[list] = None
+):
+    # LineDim takes a route's operator from the vehicles serving it; counted over every loaded
+    # day rather than the hour, so routes without delays in the hour still get one
+    dbsession.execute(
+        f"""
+        create or replace table route_vehicles as
+        select "Route", "Vehicle No", count(*) as delays
+        from {delays_sql}
+        group by all
+        """,
+        params or [],
+    )
+
+
+@instrumented_loader("load_delays", ["delays"])
 def load_delays_into_duckdb(
     as_of: pendulum.Date,
     dbsession: duckdb.DuckDBPyConnection,
+    state_path: Optional[str] = None,
+    hour: Optional[int] = None,
+    landing_dir: Optional[str] = None,
 ):
-    df = _merge_delay_files(as_of)
+    """
+    Load the day's delays into the `delays` table, and the delays per route and vehicle of
+    the whole day into `route_vehicles`.
+
+    Without `state_path` every csv of the day is parsed. With it, loading is incremental:
+    `state_path` is a persistent database holding the rows parsed so far plus a manifest
+    of the files (name, size, mtime) they came from, and only new or changed files are parsed.
+    With `landing_dir`, new or changed files are converted to Parquet partitioned by day and
+    hour instead, and only the partitions of the requested day or hour are read back.
+
+    :param as_of: Day to load.
+    :param dbsession: Session to load the table into.
+    :param state_path: Persistent database for incremental loads, one per day.
+    :param hour: Only keep delays from this hour (UTC) of the day.
+    :param landing_dir: Landing zone for incremental loads, exclusive with `state_path`.
+    """
+    if state_path is not None and landing_dir is not None:
+        raise ValueError("state_path and landing_dir are mutually exclusive")
+
+    hour_filter, params = "", []
+    if hour is not None:
+        hour_filter = 'where "Timestamp" = ?'
+        params = [pendulum.datetime(as_of.year, as_of.month, as_of.day, hour)]
+
+    configure_session(dbsession)
+    if landing_dir is not None:
+        dataset_dir = _land_delays(as_of, dbsession, landing_dir)
+        partition_filter, partition_params = "day = ?", [as_of]
+        if hour is not None:
+            partition_filter += ' and hour = ? and "Timestamp" = ?'
+            partition_params += [hour, *params]
+        dbsession.execute(
+            f"""
+            create or replace table delays as
+            select * exclude (day, hour) from {read_landed_sql(dataset_dir)}
+            where {partition_filter}
+            """,
+            partition_params,
+        )
+        _create_route_vehicles(
+            dbsession, f"{read_landed_sql(dataset_dir)} where day = ?", [as_of]
+        )
+        return
+
+    if state_path is None:
+        day_sql = f"({_normalized_delays_sql(_get_delay_files(as_of))})"
+        if hour is not None:
+            # route_vehicles needs the whole day, keep it rather than parsing the files twice
+            dbsession.execute(
+                f"create or replace temp table delays_day as select * from {day_sql}"
+            )
+            day_sql = "delays_day"
+        dbsession.execute(
+            f"create or replace table delays as select * from {day_sql} {hour_filter}",
+            params,
+        )
+        _create_route_vehicles(dbsession, day_sql if hour is not None else "delays")
+        dbsession.execute("drop table if exists delays_day")
+        return
+
+    state_alias = "delays_state"
+    with file_lock(f"{state_path}.lock"):
+        dbsession.execute(f"attach {quote_literal(state_path)} as {state_alias}")
+        try:
+            _sync_delays_state(as_of, dbsession, state_alias)
+            dbsession.execute(
+                f"""
+                create or replace table delays as
+                select * exclude (source_file) from {state_alias}.delays
+                {hour_filter}
+                """,
+                params,
+            )
+            _create_route_vehicles(dbsession, f"{state_alias}.delays")
+        finally:
+            dbsession.execute(f"detach {state_alias}")
+
+
+@instrumented_loader("load_delays_range", ["delays"])
+def load_delays_range_into_duckdb(
+    days: List[pendulum.Date],
+    dbsession: duckdb.DuckDBPyConnection,
+    landing_dir: Optional[str] = None,
+):
+    """
+    Load the delays of several days into the `delays` table with a single scan, and their
+    delays per route and vehicle into `route_vehicles`. Days without a delays folder are skipped.
+
+    :param days: Days to load.
+    :param dbsession: Session to load the table into.
+    :param landing_dir: Read through the landing zone, landing what's missing first.
+    """
+    days = [d for d in days if os.path.isdir(_delays_day_dir(d))]
+    if not days:
+        raise FileNotFoundError("No delays to load in the given days")
 
-    df["Vehicle No"] = df["Vehicle No"].apply(lambda x: None if pd.isna(x) else str(x))
-    df["Delay"] = df["Delay"].apply(_normalize_delay)
-    df["Timestamp"] = df["Timestamp"].apply(_normalize_timestamp)
+    configure_session(dbsession)
+    if landing_dir is None:
+        files = [f for d in days for f in _get_delay_files(d)]
+        dbsession.execute(
+            f"create or replace table delays as {_normalized_delays_sql(files)}"
+        )
+        _create_route_vehicles(dbsession, "delays")
+        return
 
-    tmp_view_name = "_tmp_delays"
-    dbsession.register(tmp_view_name, df)
+    for d in days:
+        _land_delays(d, dbsession, landing_dir)
     dbsession.execute(
-        f"create or replace table delays as select * from {tmp_view_name}"
+        f"""
+        create or replace table delays as
+        select * exclude (day, hour) from {read_landed_sql(f"{landing_dir}/delays")}
+        where day in ({", ".join("?" for _ in days)})
+        """,
+        days,
     )
-    dbsession.unregister(tmp_view_name)
+    _create_route_vehicles(dbsession, "delays")
@@ -0,0 +1,86 @@
+"""
+Digests of the unique keys already published, one persistent database per `Table`.
+Stages export only rows whose key digest isn't there yet, so day-cumulative inputs don't
+upload and MERGE the same rows every hour. The MERGE still skips existing rows, so losing
+or resetting a digest database only costs one full upload.
+"""
+
+import contextlib
+import hashlib
+import os
+from typing import Iterator, List
+
+import duckdb
+
+from src.ingestion import quote_identifier, quote_literal
+from src.locking import file_lock
+
+DIGESTS_ALIAS = "published_digests"
+
+
+def key_digest_sql(key_columns: List[str], alias: str) -> str:
+    columns = ", ".join(f"{alias}.{quote_identifier(k)}" for k in key_columns)
+    return f"hash({columns})"
+
+
+def _digests_table(key_columns: List[str]) -> str:
+    # hash() may change between DuckDB versions, and digests of other keys are meaningless;
+    # either way a fresh table starts, and the first upload after it is a full one
+    fingerprint = hashlib.sha1(
+        f"{key_columns}{duckdb.__version__}".encode()
+    ).hexdigest()[:12]
+    return f"{DIGESTS_ALIAS}.keys_{fingerprint}"
+
+
+@contextlib.contextmanager
+def attached_digests(
+    dbsession: duckdb.DuckDBPyConnection, digest_path: str, key_columns: List[str]
+) -> Iterator[str]:
+    """
+    Attach the digest database at `digest_path` for the duration of the block, even to
+    a read-only session, holding its lock meanwhile.
+
+    :return: Qualified name of the table holding the digests of `key_columns`.
+    """
+    os.makedirs(os.path.dirname(digest_path) or ".", exist_ok=True)
+    with file_lock(f"{digest_path}.lock"):
+        dbsession.execute(
+            f"attach {quote_literal(digest_path)} as {DIGESTS_ALIAS} (read_only false)"
+        )
+        try:
+            table = _digests_table(key_columns)
+            dbsession.execute(f"create table if not exists {table} (digest ubigint)")
+            yield table
+        finally:
+            dbsession.execute(f"detach {DIGESTS_ALIAS}")
+
+
+def unpublished_sql(query: str, key_columns: List[str], digests_table: str) -> str:
+    """
+    Wrap `query` so it only yields rows whose key isn't in `digests_table`.
+    Digests are 64-bit, a new key colliding with a published one is negligibly unlikely.
+    """
+    return f"""
+    select q.* from ({query}) q
+    anti join {digests_table} p on p.digest = {key_digest_sql(key_columns, "q")}
+    """
+
+
+def record_published(
+    dbsession: duckdb.DuckDBPyConnection,
+    digest_path: str,
+    key_columns: List[str],
+    chunks: List[str],
+):
+    """
+    Add the keys of the exported `chunks` to the digests, once they are merged into BigQuery.
+    Recording the same chunks again, as a retry after a crash might, adds nothing.
+    """
+    files = ", ".join(quote_literal(c) for c in chunks)
+    with attached_digests(dbsession, digest_path, key_columns) as digests_table:
+        dbsession.execute(f"""
+            insert into {digests_table}
+            select distinct {key_digest_sql(key_columns, "c")} as digest
+            from read_parquet([{files}]) c
+            anti join {digests_table} p on p.digest = {key_digest_sql(key_columns, "c")}
+            """)
@@ -1,7 +1,6 @@
+import dataclasses
 import enum
-from typing import List
-
-from google.cloud.bigquery import SchemaField
+from typing import TYPE_CHECKING, List, Optional
 
 from src.queries import (
     LINE_DIM_QUERY,
@@ -11,37 +10,68 @@ from src.queries import (
     TIME_DIM_QUERY,
     DELAY_FACT_QUERY,
 )
-from src.schemas import (
-    LINE_DIM_SCHEMA,
-    STOP_DIM_SCHEMA,
-    VEHICLE_DIM_SCHEMA,
-    WEATHER_DIM_SCHEMA,
-    TIME_DIM_SCHEMA,
-    DELAY_FACT_SCHEMA,
-)
+
+if TYPE_CHECKING:
+    from google.cloud.bigquery import SchemaField
+
+
+@dataclasses.dataclass(frozen=True)
+class RangePartitioning:
+    """
+    Integer range partitioning of a BigQuery table, one partition per `interval` of `column`
+    from `start` (inclusive) to `end` (exclusive).
+    """
+
+    column: str
+    start: int
+    end: int
+    interval: int
+
+
+# time ids are YYYYMMDDHH, so an interval of 10000 is one partition per month;
+# daily ones would need 100 and BigQuery's 10000 partition cap would be hit within a year
+TIME_ID_PARTITIONING = RangePartitioning("time_id", 2024000000, 2034000000, 10000)
 
 
 class Table(enum.Enum):
-    LINE = ("LineDim", ["id"], LINE_DIM_SCHEMA, LINE_DIM_QUERY)
-    STOP = ("StopDim", ["id"], STOP_DIM_SCHEMA, STOP_DIM_QUERY)
-    VEHICLE = ("VehicleDim", ["id"], VEHICLE_DIM_SCHEMA, VEHICLE_DIM_QUERY)
-    WEATHER = ("WeatherDim", ["id"], WEATHER_DIM_SCHEMA, WEATHER_DIM_QUERY)
-    TIME = ("TimeDim", ["id"], TIME_DIM_SCHEMA, TIME_DIM_QUERY)
+    LINE = ("LineDim", ["id"], "LINE_DIM_SCHEMA", LINE_DIM_QUERY)
+    STOP = ("StopDim", ["id"], "STOP_DIM_SCHEMA", STOP_DIM_QUERY)
+    VEHICLE = ("VehicleDim", ["id"], "VEHICLE_DIM_SCHEMA", VEHICLE_DIM_QUERY)
+    WEATHER = ("WeatherDim", ["id"], "WEATHER_DIM_SCHEMA", WEATHER_DIM_QUERY)
+    TIME = ("TimeDim", ["id"], "TIME_DIM_SCHEMA", TIME_DIM_QUERY)
     DELAY = (
         "DelayFact",
         ["time_id", "weather_id", "vehicle_id", "line_id", "stop_id"],
-        DELAY_FACT_SCHEMA,
+        "DELAY_FACT_SCHEMA",
         DELAY_FACT_QUERY,
+        TIME_ID_PARTITIONING,
+        ["line_id", "stop_id"],
     )
 
     def __init__(
         self,
         bigquery_table: str,
         unique_key_columns: List[str],
-        schema: List[SchemaField],
+        schema_name: str,
         duckdb_query: str,
+        partitioning: Optional[RangePartitioning] = None,
+        clustering_columns: Optional[List[str]] = None,
     ):
         self.bigquery_table = bigquery_table
         self.unique_key_columns = unique_key_columns
-        self.schema = schema
+        self.schema_name = schema_name
         self.duckdb_query = duckdb_query
+        self.partitioning = partitioning
+        self.clustering_columns = clustering_columns or []
+
+    @property
+    def schema(self) -> List["SchemaField"]:
+        # src.schemas needs google-cloud-bigquery, which takes most of a second to import;
+        # the DAG lists tables while it is parsed, but only tasks read their schemas
+        from src import schemas
+
+        return getattr(schemas, self.schema_name)
+
+    @property
+    def is_fact(self) -> bool:
+        return self.bigquery_table.endswith("Fact")
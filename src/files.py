@@ -0,0 +1,31 @@
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path: str, value: Any):
+    """
+    Replace the JSON file at `path` in one step, so a crash mid-write leaves the old contents.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(value, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def file_stats(paths: List[str]) -> Dict[str, Tuple[int, float]]:
+    """
+    Size and mtime of each file, enough to notice one was rewritten.
+    """
+    stats = {}
+    for path in paths:
+        stat = os.stat(path)
+        stats[path] = (stat.st_size, stat.st_mtime)
+    return stats
@@ -1,7 +1,19 @@
+from typing import Optional
+
 import duckdb
-import pandas as pd
 from pendulum import Date
 
+from src.ingestion import (
+    configure_session,
+    csv_select_sql,
+    load_csv_into_duckdb,
+    quote_literal,
+    SURROGATE_KEY_VERSION,
+)
+from src.instrumentation import instrumented_loader
+from src.landing import land_files, read_landed_sql
+from src.static_cache import load_with_cache
+
 # we only need a subset of GTFS files for our analysis
 GTFS_FILES = [
     "routes",
@@ -9,20 +21,120 @@ GTFS_FILES = [
     "stops",
     "trips",
 ]
+# derived from the files above once per feed, so queries don't rescan stop_times
+GTFS_DERIVED_TABLES = ["trip_stats"]
+GTFS_TABLES = [*GTFS_FILES, *GTFS_DERIVED_TABLES]
 GTFS_FILE_EXTENSION = "csv"
 GTFS_BUCKET = "gtfs"
+GTFS_LOCAL_DIR = "data/gtfs"
+
+# ids are strings in GTFS even when they look numeric, keep them that way so joins line up;
+# stop times go past 24:00:00 for night services, so they can't be sniffed as TIME
+GTFS_COLUMN_TYPES = {
+    "routes": {"route_id": "VARCHAR", "route_type": "INTEGER"},
+    "stop_times": {
+        "trip_id": "VARCHAR",
+        "arrival_time": "VARCHAR",
+        "departure_time": "VARCHAR",
+        "stop_id": "VARCHAR",
+        "shape_dist_traveled": "DOUBLE",
+    },
+    "stops": {
+        "stop_id": "VARCHAR",
+        "stop_name": "VARCHAR",
+        "stop_lat": "DOUBLE",
+        "stop_lon": "DOUBLE",
+    },
+    "trips": {"route_id": "VARCHAR", "trip_id": "VARCHAR"},
+}
+
+# surrogate keys delays are joined on, so the fact query doesn't hash strings on every run
+GTFS_KEY_COLUMNS = {
+    "routes": {"route_key": "route_id"},
+    "stops": {"stop_name_key": "stop_name"},
+}
+
+
+TRIP_STATS_QUERY = """
+select
+    t.route_id,
+    t.trip_id,
+    max(st.shape_dist_traveled) as trip_len,
+    count(distinct st.stop_id) as stops_per_trip
+from trips t
+left join stop_times st on t.trip_id = st.trip_id
+group by t.route_id, t.trip_id
+"""
+
+
+def gtfs_blob_prefix(as_of: Date) -> str:
+    return f"{as_of.year}/{as_of.month}/{as_of.day}/"
 
 
+def _gtfs_path(as_of: Date, file_name: str) -> str:
+    return (
+        f"{GTFS_LOCAL_DIR}/{gtfs_blob_prefix(as_of)}{file_name}.{GTFS_FILE_EXTENSION}"
+    )
+
+
+def _load_landed_gtfs_file(
+    as_of: Date,
+    dbsession: duckdb.DuckDBPyConnection,
+    landing_dir: str,
+    file_name: str,
+):
+    dataset_dir = f"{landing_dir}/gtfs/{file_name}"
+    path = _gtfs_path(as_of, file_name)
+    land_files(
+        dbsession,
+        dataset_dir,
+        {path: [path]},
+        lambda files: f"""
+        select *, {quote_literal(as_of.isoformat())} as feed_date
+        from ({csv_select_sql(files, GTFS_COLUMN_TYPES[file_name], GTFS_KEY_COLUMNS.get(file_name))})
+        """,
+        ["feed_date"],
+        scope_dir=f"{GTFS_LOCAL_DIR}/{gtfs_blob_prefix(as_of)}",
+        fingerprint=f"{SURROGATE_KEY_VERSION}{GTFS_COLUMN_TYPES[file_name]}{GTFS_KEY_COLUMNS.get(file_name)}",
+    )
+    configure_session(dbsession)
+    dbsession.execute(
+        f"""
+        create or replace table {file_name} as
+        select * exclude (feed_date) from {read_landed_sql(dataset_dir)}
+        where feed_date = ?
+        """,
+        [as_of],
+    )
+
+
+@instrumented_loader("load_gtfs", GTFS_TABLES)
 def load_gtfs_into_duckdb(
     as_of: Date,
     dbsession: duckdb.DuckDBPyConnection,
+    cache_dir: Optional[str] = None,
+    landing_dir: Optional[str] = None,
 ):
-    for file_name in GTFS_FILES:
-        path = f"data/gtfs/{as_of.year}/{as_of.month}/{as_of.day}/{file_name}.{GTFS_FILE_EXTENSION}"
-        df = pd.read_csv(path)
-        tmp_view_name = f"_tmp_{file_name}"
-        dbsession.register(tmp_view_name, df)
-        dbsession.execute(
-            f"create or replace table {file_name} as select * from {tmp_view_name}"
-        )
-        dbsession.unregister(tmp_view_name)
+    def load():
+        for file_name in GTFS_FILES:
+            if landing_dir is None:
+                load_csv_into_duckdb(
+                    dbsession,
+                    file_name,
+                    [_gtfs_path(as_of, file_name)],
+                    GTFS_COLUMN_TYPES[file_name],
+                    GTFS_KEY_COLUMNS.get(file_name),
+                )
+            else:
+                _load_landed_gtfs_file(as_of, dbsession, landing_dir, file_name)
+        dbsession.execute(f"create or replace table trip_stats as {TRIP_STATS_QUERY}")
+
+    load_with_cache(
+        dbsession,
+        cache_dir,
+        [_gtfs_path(as_of, f) for f in GTFS_FILES],
+        GTFS_TABLES,
+        as_of,
+        load,
+        fingerprint=f"{GTFS_COLUMN_TYPES}{GTFS_KEY_COLUMNS}{TRIP_STATS_QUERY}",
+    )
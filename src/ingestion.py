@@ -0,0 +1,135 @@
+import csv
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def surrogate_key_sql(column: str) -> str:
+    # hash() maps NULL to a value as well, keep it NULL so it never joins
+    return f"if({column} is null, null, hash({column}))"
+
+
+# hash() may change between DuckDB versions, so persisted keys only join keys computed by the same
+# version and expression; anything persisting them should be rebuilt when this changes
+SURROGATE_KEY_VERSION = f"duckdb {duckdb.__version__}: {surrogate_key_sql('column')}"
+
+
+def configure_session(dbsession: duckdb.DuckDBPyConnection):
+    # raw inputs have no meaningful row order; dropping it lets DuckDB stream
+    # the parallel csv scan into the table instead of buffering it in memory
+    # memory and threads are set when the session is opened, see src.sessions
+    dbsession.execute("set preserve_insertion_order = false")
+
+
+def _csv_header(path: str) -> Tuple[str, ...]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return tuple(next(csv.reader(f), []))
+
+
+def _read_csv_unsniffed_sql(
+    paths: Sequence[str], types: Dict[str, str], filename: bool
+) -> str:
+    # sniffing costs a few milliseconds per file, which dominates for many small files;
+    # files sharing a header are read in one call with the column list spelled out
+    by_header: Dict[Tuple[str, ...], List[str]] = {}
+    for path in paths:
+        by_header.setdefault(_csv_header(path), []).append(path)
+
+    scans = []
+    for header, group in by_header.items():
+        files = ", ".join(quote_literal(p) for p in group)
+        columns = ", ".join(
+            f"{quote_literal(c)}: {quote_literal(types.get(c, 'VARCHAR'))}"
+            for c in header
+        )
+        options = ["header = true", "auto_detect = false", f"columns = {{{columns}}}"]
+        if filename:
+            options.append("filename = true")
+        scans.append(f"select * from read_csv([{files}], {', '.join(options)})")
+    return f"({' union all by name '.join(scans)})"
+
+
+def read_csv_sql(
+    paths: Sequence[str],
+    types: Optional[Dict[str, str]] = None,
+    filename: bool = False,
+    sniff: bool = True,
+) -> str:
+    """
+    Build a `read_csv` table function call over one or more csv files.
+    Files are matched by column name, so differing column order between files is fine.
+
+    :param paths: Csv files to read.
+    :param types: Explicit DuckDB types for the given columns, the rest is sniffed.
+    :param filename: Add a `filename` column with the path each row was read from.
+    :param sniff: Sniff the dialect and the columns missing from `types`. Without it,
+        files must be plain comma separated with a header and other columns are read as VARCHAR.
+    :return: SQL fragment usable in a `from` clause.
+    """
+    if not paths:
+        raise FileNotFoundError("No csv files to read")
+    if not sniff:
+        return _read_csv_unsniffed_sql(paths, types or {}, filename)
+
+    files = ", ".join(quote_literal(p) for p in paths)
+    options = ["header = true", "union_by_name = true"]
+    if types:
+        columns = ", ".join(
+            f"{quote_literal(c)}: {quote_literal(t)}" for c, t in types.items()
+        )
+        options.append(f"types = {{{columns}}}")
+    if filename:
+        options.append("filename = true")
+
+    return f"read_csv([{files}], {', '.join(options)})"
+
+
+def csv_select_sql(
+    paths: Sequence[str],
+    types: Optional[Dict[str, str]] = None,
+    keys: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Build a query over csv files, adding surrogate key columns.
+
+    :param paths: Csv files to read.
+    :param types: Explicit DuckDB types for the given columns, the rest is sniffed.
+    :param keys: Surrogate key columns to add, mapped to the column each one hashes.
+    :return: Select statement.
+    """
+    key_columns = "".join(
+        f", {surrogate_key_sql(source)} as {key}"
+        for key, source in (keys or {}).items()
+    )
+    return f"select *{key_columns} from {read_csv_sql(paths, types)}"
+
+
+def load_csv_into_duckdb(
+    dbsession: duckdb.DuckDBPyConnection,
+    table_name: str,
+    paths: Sequence[str],
+    types: Optional[Dict[str, str]] = None,
+    keys: Optional[Dict[str, str]] = None,
+):
+    """
+    Load csv files straight into a DuckDB table, without going through pandas.
+
+    :param dbsession: Session to load the table into.
+    :param table_name: Name of the table to (re)create.
+    :param paths: Csv files to load, read in parallel by DuckDB.
+    :param types: Explicit DuckDB types for the given columns, the rest is sniffed.
+    :param keys: Surrogate key columns to add, mapped to the column each one hashes.
+    """
+    configure_session(dbsession)
+    dbsession.execute(
+        f"create or replace table {table_name} as {csv_select_sql(paths, types, keys)}"
+    )
@@ -0,0 +1,311 @@
+"""
+Wall time, CPU time, peak RSS, rows and bytes read of every pipeline stage, written per run
+as JSON and optionally as OpenMetrics text.
+
+    python -m src.instrumentation <run metrics dir> [<baseline run metrics dir>]
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import datetime
+import functools
+import glob
+import inspect
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import duckdb
+
+METRICS_OPENMETRICS = os.getenv("METRICS_OPENMETRICS", "false").lower() == "true"
+
+log = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class StageMetrics:
+    stage: str
+    labels: Dict[str, str]
+    started_at: str
+    wall_s: float = 0.0
+    # CPU time of the whole process, DuckDB's worker threads included
+    cpu_s: float = 0.0
+    # high-water mark of the process while the stage ran, where linux lets it be reset
+    peak_rss_mb: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    bytes_read: Optional[int] = None
+    failed: bool = False
+
+
+_records: List[StageMetrics] = []
+_records_lock = threading.Lock()
+# peaks of the stages still running, kept up to date whenever one of them resets the mark
+_open_peaks: Dict[int, float] = {}
+_peaks_lock = threading.Lock()
+# set in threads running side by side with others, see `shared_io`
+_io_shared = threading.local()
+
+
+def peak_rss_mb() -> float:
+    """
+    High-water mark of the process RSS since it started or since `reset_peak_rss`.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos reports bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss():
+    """
+    Restart the high-water mark from the current RSS. Only linux allows it, elsewhere
+    `peak_rss_mb` stays the peak of the whole process lifetime.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _start_peak(key: int):
+    with _peaks_lock:
+        current = peak_rss_mb()
+        for other in _open_peaks:
+            _open_peaks[other] = max(_open_peaks[other], current)
+        reset_peak_rss()
+        _open_peaks[key] = 0.0
+
+
+def _end_peak(key: int) -> float:
+    with _peaks_lock:
+        return max(_open_peaks.pop(key), peak_rss_mb())
+
+
+def _bytes_read() -> Optional[int]:
+    # bytes the process got from read syscalls, page cache hits included; linux only
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+@contextlib.contextmanager
+def shared_io() -> Iterator[None]:
+    """
+    Mark the current thread as one of several running side by side. Its stages leave
+    `bytes_read` unset, as the process I/O counters include the reads of the other threads;
+    the stage around all of them still counts.
+    """
+    _io_shared.active = True
+    try:
+        yield
+    finally:
+        _io_shared.active = False
+
+
+@contextlib.contextmanager
+def track(
+    stage: str, labels: Optional[Dict[str, str]] = None, count_io: bool = True
+) -> Iterator[StageMetrics]:
+    """
+    Record a stage. The caller fills in rows (and bytes read, with `count_io` off) on the
+    yielded metrics; times and peak RSS are filled in when the block exits, even on failure.
+
+    :param stage: Stage name, e.g. `load_gtfs` or `bigquery_load`.
+    :param labels: What the stage worked on, e.g. the table.
+    :param count_io: Take bytes read from the process I/O counters. They are process wide,
+        so stages running concurrently with others should set `bytes_read` themselves or
+        run under `shared_io`.
+    :return: Metrics of the stage.
+    """
+    metrics = StageMetrics(
+        stage,
+        {k: str(v) for k, v in (labels or {}).items()},
+        datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    )
+    _start_peak(id(metrics))
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    count_io = count_io and not getattr(_io_shared, "active", False)
+    start_read = _bytes_read() if count_io else None
+    try:
+        yield metrics
+    except BaseException:
+        metrics.failed = True
+        raise
+    finally:
+        metrics.wall_s = time.perf_counter() - start_wall
+        metrics.cpu_s = time.process_time() - start_cpu
+        metrics.peak_rss_mb = _end_peak(id(metrics))
+        if start_read is not None and metrics.bytes_read is None:
+            metrics.bytes_read = _bytes_read() - start_read
+        with _records_lock:
+            _records.append(metrics)
+        log.info(
+            f"{stage} {metrics.labels}: {metrics.wall_s:.2f}s wall, {metrics.cpu_s:.2f}s cpu, "
+            f"{metrics.peak_rss_mb:.0f} MB peak RSS, rows {metrics.rows_in} -> {metrics.rows_out}, "
+            f"{metrics.bytes_read} bytes read"
+        )
+
+
+def table_rows(dbsession: duckdb.DuckDBPyConnection, tables: List[str]) -> int:
+    return sum(
+        dbsession.execute(f"select count(*) from {t}").fetchone()[0] for t in tables
+    )
+
+
+def instrumented_loader(stage: str, tables: List[str]) -> Callable:
+    """
+    Decorate a loader taking a `dbsession` argument, so each call is recorded as `stage`
+    with the rows of `tables` as rows out and its `as_of`, `start`, `end` and `hour`
+    arguments as labels.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            labels = {
+                k: arguments[k]
+                for k in ["as_of", "start", "end", "hour"]
+                if arguments.get(k) is not None
+            }
+            with track(stage, labels) as metrics:
+                result = fn(*args, **kwargs)
+                metrics.rows_out = table_rows(arguments["dbsession"], tables)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def collected_metrics() -> List[StageMetrics]:
+    with _records_lock:
+        return list(_records)
+
+
+def metrics_json(records: List[StageMetrics]) -> str:
+    return json.dumps(
+        {"pid": os.getpid(), "stages": [dataclasses.asdict(r) for r in records]},
+        indent=2,
+    )
+
+
+def _openmetrics_labels(record: StageMetrics) -> str:
+    labels = {"stage": record.stage, **record.labels}
+    escaped = {
+        k: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for k, v in labels.items()
+    }
+    return ",".join(f'{k}="{v}"' for k, v in escaped.items())
+
+
+def metrics_openmetrics(records: List[StageMetrics]) -> str:
+    families = [
+        ("idh_stage_wall_seconds", "Wall time of the stage", lambda r: r.wall_s),
+        (
+            "idh_stage_cpu_seconds",
+            "Process CPU time during the stage",
+            lambda r: r.cpu_s,
+        ),
+        (
+            "idh_stage_peak_rss_bytes",
+            "Peak RSS of the process during the stage",
+            lambda r: int(r.peak_rss_mb * 2**20),
+        ),
+        ("idh_stage_rows_in", "Rows the stage consumed", lambda r: r.rows_in),
+        ("idh_stage_rows_out", "Rows the stage produced", lambda r: r.rows_out),
+        ("idh_stage_read_bytes", "Bytes the stage read", lambda r: r.bytes_read),
+        ("idh_stage_failed", "Whether the stage failed", lambda r: int(r.failed)),
+    ]
+    lines = []
+    for name, help_text, value in families:
+        lines += [f"# TYPE {name} gauge", f"# HELP {name} {help_text}."]
+        lines += [
+            f"{name}{{{_openmetrics_labels(r)}}} {value(r)}"
+            for r in records
+            if value(r) is not None
+        ]
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics_dir: str, name: str) -> List[str]:
+    """
+    Write the stages recorded so far to `metrics_dir/name.json` (and `name.prom` with
+    METRICS_OPENMETRICS), then forget them, so a reused process starts from scratch.
+
+    :param metrics_dir: Directory of the run, shared by all of its tasks.
+    :param name: File name of this task's metrics.
+    :return: Paths written.
+    """
+    with _records_lock:
+        records = list(_records)
+        _records.clear()
+
+    os.makedirs(metrics_dir, exist_ok=True)
+    outputs = {f"{name}.json": metrics_json(records)}
+    if METRICS_OPENMETRICS:
+        outputs[f"{name}.prom"] = metrics_openmetrics(records)
+    paths = []
+    for file_name, content in outputs.items():
+        path = os.path.join(metrics_dir, file_name)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+        paths.append(path)
+    return paths
+
+
+def read_run_metrics(metrics_dir: str) -> List[StageMetrics]:
+    records = []
+    for path in sorted(glob.glob(os.path.join(metrics_dir, "*.json"))):
+        with open(path) as f:
+            records += [StageMetrics(**s) for s in json.load(f)["stages"]]
+    return records
+
+
+def _wall_by_stage(records: List[StageMetrics]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for r in records:
+        totals[r.stage] = totals.get(r.stage, 0.0) + r.wall_s
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wall time per stage of a run")
+    parser.add_argument("run", help="Metrics directory of the run")
+    parser.add_argument("baseline", nargs="?", help="Metrics directory to compare to")
+    args = parser.parse_args()
+
+    run = _wall_by_stage(read_run_metrics(args.run))
+    baseline = _wall_by_stage(read_run_metrics(args.baseline)) if args.baseline else {}
+    for stage, wall_s in sorted(run.items(), key=lambda s: -s[1]):
+        line = f"{stage:<32} {wall_s:>9.2f}s"
+        if stage in baseline:
+            line += f" {wall_s - baseline[stage]:>+9.2f}s vs baseline"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import glob
+import hashlib
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+import duckdb
+
+from src.files import file_stats, read_json, write_json
+from src.ingestion import configure_session, quote_literal
+from src.locking import file_lock
+from src.settings import env_choice
+
+# csv: loaders parse the raw csv files on every run
+# landing: raw files are converted once into hive-partitioned Parquet, loaders read that
+INGESTION_MODES = ["csv", "landing"]
+INGESTION_MODE = env_choice("INGESTION_MODE", INGESTION_MODES, "csv")
+
+log = logging.getLogger(__name__)
+
+
+def _remove_batch(dataset_dir: str, batch: str) -> str:
+    # batches are identified by a digest in the Parquet file names, so a rerun
+    # replaces exactly the files it wrote last time
+    stem = hashlib.sha1(batch.encode()).hexdigest()[:16]
+    for old in glob.glob(
+        os.path.join(dataset_dir, "**", f"{stem}_*.parquet"), recursive=True
+    ):
+        os.remove(old)
+    return stem
+
+
+def land_files(
+    dbsession: duckdb.DuckDBPyConnection,
+    dataset_dir: str,
+    batches: Dict[str, List[str]],
+    select_sql: Callable[[List[str]], str],
+    partition_by: List[str],
+    scope_dir: Optional[str] = None,
+    fingerprint: str = "",
+) -> int:
+    """
+    Convert raw files into zstd Parquet under `dataset_dir`, hive-partitioned by `partition_by`.
+
+    Files are landed in batches; a batch is converted again only when one of its files
+    changed (size or mtime) or `fingerprint` did, replacing the Parquet files it produced before.
+
+    :param dbsession: Session used for the conversion.
+    :param dataset_dir: Root of the partitioned dataset.
+    :param batches: Batch name to the raw files converted together.
+    :param select_sql: Query over a batch's files, producing the `partition_by` columns too.
+    :param partition_by: Columns the dataset is partitioned by.
+    :param scope_dir: Directory holding every raw file of this scope, e.g. one day. Batches landed
+        from files under it before, whose files are all gone now, are removed with their Parquet.
+        Batches of other scopes are never touched, and without it nothing is removed.
+    :param fingerprint: Anything else the landed rows depend on, e.g. the DuckDB version
+        computing their surrogate keys, see `src.ingestion.SURROGATE_KEY_VERSION`.
+    :return: Number of batches converted.
+    """
+    os.makedirs(dataset_dir, exist_ok=True)
+    with file_lock(os.path.join(dataset_dir, "_manifest.lock")):
+        manifest_path = os.path.join(dataset_dir, "_manifest.json")
+        manifest = read_json(manifest_path, {})
+        configure_session(dbsession)
+        landed = 0
+        for batch, files in batches.items():
+            entry = {
+                "files": {f: list(s) for f, s in file_stats(files).items()},
+                "fingerprint": fingerprint,
+            }
+            if manifest.get(batch) == entry:
+                continue
+
+            stem = _remove_batch(dataset_dir, batch)
+            dbsession.execute(f"""
+                copy ({select_sql(files)}) to {quote_literal(dataset_dir)} (
+                    format parquet,
+                    compression zstd,
+                    partition_by ({", ".join(partition_by)}),
+                    overwrite_or_ignore,
+                    filename_pattern '{stem}_{{i}}'
+                )
+                """)
+            manifest[batch] = entry
+            landed += 1
+        # batches of this scope whose raw files are all gone take their rows with them
+        scope = os.path.join(os.path.abspath(scope_dir), "") if scope_dir else None
+        for batch in [b for b in manifest if b not in batches]:
+            # entries landed before fingerprints were recorded hold the file stats alone
+            files = manifest[batch].get("files", manifest[batch])
+            in_scope = scope is not None and all(
+                os.path.abspath(f).startswith(scope) for f in files
+            )
+            if in_scope and not any(os.path.exists(f) for f in files):
+                _remove_batch(dataset_dir, batch)
+                del manifest[batch]
+        write_json(manifest_path, manifest)
+
+    log.info(f"Landed {landed} of {len(batches)} batches into {dataset_dir}")
+    return landed
+
+
+def read_landed_sql(dataset_dir: str) -> str:
+    """
+    Build a `read_parquet` call over a landed dataset. Filters on the partition columns
+    prune whole directories, and only the columns a query uses are read.
+
+    :param dataset_dir: Root of the partitioned dataset.
+    :return: SQL fragment usable in a `from` clause.
+    """
+    files = quote_literal(os.path.join(dataset_dir, "**", "*.parquet"))
+    return f"read_parquet({files}, hive_partitioning = true)"
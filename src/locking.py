@@ -0,0 +1,18 @@
+import contextlib
+import fcntl
+from typing import Iterator
+
+
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive advisory lock on `path`, shared between processes on the same host.
+    DuckDB allows a single writer process per database file, so concurrent DAG runs
+    touching the same persistent database take this lock first instead of failing.
+    """
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
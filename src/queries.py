@@ -1,77 +1,58 @@
 """
 - calculate route_length_km
-    1. routes left join trips using (route_id) left join stop_times st using (trip_id)
-    2. max(st.shape_dist_traveled) as trip_len per each route
-    3. most frequent value of trip_len per each route is approx. route_length_km
+    1. trip_stats holds max(stop_times.shape_dist_traveled) as trip_len per each trip
+    2. most frequent value of trip_len per each route is approx. route_length_km
 - calculate stops_amount
-    1. routes left join trips using (route_id)
-    2. count(distinct trips.stop_id) as stops_per_trip per each route
-    3. most frequent value of stops_per_trip per each route is approx. stops_amount
+    1. trip_stats holds count(distinct stop_times.stop_id) as stops_per_trip per each trip
+    2. most frequent value of stops_per_trip per each route is approx. stops_amount
+- calculate operator
+    1. route_vehicles holds count(*) of the loaded day's delays per route and vehicle number
+    2. joined with vehicles on vehicle number it gives the carriers serving each route
+    3. most frequent carrier per each route is the operator
 """
 
 LINE_DIM_QUERY = """
-with trip_lengths as (
-    select
-        t.route_id,
-        t.trip_id,
-        max(st.shape_dist_traveled) as trip_len
-    from trips t
-    left join stop_times st on t.trip_id = st.trip_id
-    group by t.route_id, t.trip_id
-),
-trip_len_mode as (
+with trip_len_mode as (
     select
         route_id,
         trip_len,
-        count(*) as freq,
         row_number() over (partition by route_id order by count(*) desc, trip_len desc) as rn
-    from trip_lengths
+    from trip_stats
     group by route_id, trip_len
 ),
-route_length_mode as (
-    select route_id, trip_len as route_length_km
-    from trip_len_mode
-    where rn = 1
-),
-stops_per_trip as (
-    select
-        t.route_id,
-        t.trip_id,
-        count(distinct st.stop_id) as stops_per_trip
-    from trips t
-    left join stop_times st on t.trip_id = st.trip_id
-    group by t.route_id, t.trip_id
-),
 stops_mode as (
     select
         route_id,
         stops_per_trip,
-        count(*) as freq,
         row_number() over (partition by route_id order by count(*) desc, stops_per_trip desc) as rn
-    from stops_per_trip
+    from trip_stats
     group by route_id, stops_per_trip
 ),
-route_stops_mode as (
-    select route_id, stops_per_trip as stops_amount
-    from stops_mode
-    where rn = 1
+carrier_mode as (
+    select
+        rv."Route" as route_id,
+        v.carrier,
+        row_number() over (partition by rv."Route" order by sum(rv.delays) desc, v.carrier) as rn
+    from route_vehicles rv
+    join vehicles v on rv."Vehicle No" = v.vehicle_number
+    where v.carrier is not null
+    group by rv."Route", v.carrier
 )
 select
     r.route_id as id,
-    v.carrier as operator,
+    cm.carrier as operator,
     case r.route_type
         when 0 then 'tram'
         when 2 then 'rail'
         when 3 then 'bus'
         else 'unknown'
     end as line_type,
-    coalesce(rl.route_length_km, 0) as route_length_km,
-    coalesce(rs.stops_amount, 0) as stops_amount
+    coalesce(tm.trip_len, 0) as route_length_km,
+    coalesce(sm.stops_per_trip, 0) as stops_amount
 from routes r
-left join delays d on r.route_id = d."Route"
-left join vehicles v on d."Vehicle No" = v.vehicle_number
-left join route_length_mode rl on r.route_id = rl.route_id
-left join route_stops_mode rs on r.route_id = rs.route_id
+left join trip_len_mode tm on r.route_id = tm.route_id and tm.rn = 1
+left join stops_mode sm on r.route_id = sm.route_id and sm.rn = 1
+left join carrier_mode cm on r.route_id = cm.route_id and cm.rn = 1
 """
 
 STOP_DIM_QUERY = """
@@ -132,7 +113,19 @@ select
 from time_dim
 """
 
+# each stop takes the weather of its nearest station, distance on an equirectangular projection
 DELAY_FACT_QUERY = """
+with stop_stations as (
+    select
+        s.stop_id,
+        arg_min(
+            ws.station_id,
+            pow(s.stop_lat - ws.lat, 2) + pow((s.stop_lon - ws.lon) * cos(radians(s.stop_lat)), 2)
+        ) as station_id
+    from stops s
+    cross join weather_stations ws
+    group by s.stop_id
+)
 select
     d.Delay as delay_mins,
     t.id as time_id,
@@ -142,8 +135,9 @@ select
     s.stop_id as stop_id
 from delays d
 join time_dim t on t.full_timestamp = d.Timestamp
-join weather w on w.id = '12375-' || strftime(cast(d.Timestamp as timestamp), '%Y-%m-%d-%H')
-join vehicles v on v.vehicle_number = d."Vehicle No"
-join routes r on r.route_id = d.Route
-join stops s on s.stop_name = d."Stop Name"
+join vehicles v on v.vehicle_key = d.vehicle_key
+join routes r on r.route_key = d.route_key
+join stops s on s.stop_name_key = d.stop_name_key
+join stop_stations ss on ss.stop_id = s.stop_id
+join weather w on w.station_id = ss.station_id and w.measured_at = d.Timestamp
 """
@@ -0,0 +1,62 @@
+import logging
+import os
+from typing import Dict, Optional
+
+import duckdb
+
+# tasks competing for the same worker get their own budget, e.g.
+# DUCKDB_LOAD_MEMORY_LIMIT=2GB overrides DUCKDB_MEMORY_LIMIT for the load tasks only
+DUCKDB_TASK_CLASSES = ["load", "merge", "publish", "backfill"]
+DUCKDB_SESSION_SETTINGS = [
+    "memory_limit",
+    "threads",
+    "temp_directory",
+    "max_temp_directory_size",
+]
+
+log = logging.getLogger(__name__)
+
+
+def _setting_from_env(task_class: str, setting: str) -> Optional[str]:
+    return os.getenv(
+        f"DUCKDB_{task_class.upper()}_{setting.upper()}",
+        os.getenv(f"DUCKDB_{setting.upper()}"),
+    )
+
+
+DUCKDB_SESSION_CONFIG = {
+    task_class: {
+        setting: value
+        for setting in DUCKDB_SESSION_SETTINGS
+        if (value := _setting_from_env(task_class, setting))
+    }
+    for task_class in DUCKDB_TASK_CLASSES
+}
+
+
+def session_config(task_class: str) -> Dict[str, str]:
+    if task_class not in DUCKDB_TASK_CLASSES:
+        raise ValueError(
+            f"Unknown task class {task_class}, expected one of {DUCKDB_TASK_CLASSES}"
+        )
+    return dict(DUCKDB_SESSION_CONFIG[task_class])
+
+
+def connect_duckdb(
+    database: str = ":memory:", task_class: str = "load", read_only: bool = False
+) -> duckdb.DuckDBPyConnection:
+    """
+    Open a DuckDB session with the memory limit, thread count and spill directory
+    configured for `task_class`. Operators that outgrow the memory limit spill to the
+    temp directory instead of failing the task.
+
+    :param database: Database file, in memory by default.
+    :param task_class: One of `DUCKDB_TASK_CLASSES`.
+    :param read_only: Open the database read only.
+    :return: Session on `database`.
+    """
+    config = session_config(task_class)
+    if "temp_directory" in config:
+        os.makedirs(config["temp_directory"], exist_ok=True)
+    log.info(f"Opening {database} for {task_class} with {config}")
+    return duckdb.connect(database, read_only=read_only, config=config)
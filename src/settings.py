@@ -0,0 +1,46 @@
+"""
+Settings that decide the shape of the DAG, or that would otherwise only fail a run after its
+loaders, read every time the scheduler parses it.
+Nothing heavier than python-dotenv is imported here; the modules doing the work are imported
+by the tasks. .env is loaded first, so its values shape the DAG and reach every later import.
+"""
+
+import os
+from typing import List
+
+import dotenv
+
+dotenv.load_dotenv()
+
+
+def env_choice(name: str, choices: List[str], default: str) -> str:
+    """
+    Read the environment variable `name`, which has to be one of `choices`.
+
+    :raises ValueError: On any other value, rather than silently running the default.
+    """
+    value = os.getenv(name, default)
+    if value not in choices:
+        raise ValueError(f"Unknown {name} {value}, expected one of {choices}")
+    return value
+
+
+# per_table: one DAG task per table, each running its own MERGE
+# batched: a single task staging all tables and MERGEing them in one script
+PUBLISH_MODES = ["per_table", "batched"]
+BIGQUERY_PUBLISH_MODE = env_choice("BIGQUERY_PUBLISH_MODE", PUBLISH_MODES, "per_table")
+
+# bigquery: MERGE into the BigQuery dataset, needs gcp-credentials.json
+# local: MERGE into a DuckDB database at LOCAL_WAREHOUSE_PATH
+PUBLISH_SINKS = ["bigquery", "local"]
+PUBLISH_SINK = env_choice("PUBLISH_SINK", PUBLISH_SINKS, "bigquery")
+
+# sharded: one task per loader, each into its own database, merged by a further task
+# consolidated: one task running every loader at once in threads, on cursors of the run database
+LOAD_MODES = ["sharded", "consolidated"]
+DUCKDB_LOAD_MODE = env_choice("DUCKDB_LOAD_MODE", LOAD_MODES, "sharded")
+
+# copy: rewrite every shard table into the run database and delete the shard files
+# attach: keep the shard files and expose their tables through views, nothing is copied
+MERGE_MODES = ["copy", "attach"]
+DUCKDB_MERGE_MODE = env_choice("DUCKDB_MERGE_MODE", MERGE_MODES, "copy")
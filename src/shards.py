@@ -0,0 +1,147 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import duckdb
+
+from src.gtfs import GTFS_TABLES
+from src.ingestion import quote_literal
+from src.instrumentation import shared_io
+from src.settings import DUCKDB_MERGE_MODE, MERGE_MODES
+
+# tables each loader task writes into its own shard database,
+# time_dim is looked up in the persistent calendar at merge time instead
+DUCKDB_SHARDS = {
+    "gtfs": GTFS_TABLES,
+    "delays": ["delays", "route_vehicles"],
+    "vehicles": ["vehicles"],
+    "weather": ["weather", "weather_stations"],
+}
+
+# run databases merged in attach mode remember their shards here
+SHARDS_TABLE = "_shards"
+
+log = logging.getLogger(__name__)
+
+
+def _shard_alias(shard_name: str) -> str:
+    return f"shard_{shard_name}"
+
+
+def _drop_relation(dbsession: duckdb.DuckDBPyConnection, name: str):
+    # a retried merge may find a table where it wants a view or vice versa
+    existing = dbsession.execute(
+        """
+        select table_type from information_schema.tables
+        where table_catalog = current_database() and table_schema = 'main' and table_name = ?
+        """,
+        [name],
+    ).fetchone()
+    if existing is not None:
+        kind = "view" if existing[0] == "VIEW" else "table"
+        dbsession.execute(f"drop {kind} {name}")
+
+
+def attach_shards(dbsession: duckdb.DuckDBPyConnection):
+    """
+    Attach the shards a run database was merged from in attach mode, so its views resolve.
+    Safe to call on databases merged by copy, where it does nothing.
+    """
+    has_shards = dbsession.execute(
+        "select count(*) from duckdb_tables() where database_name = current_database() and table_name = ?",
+        [SHARDS_TABLE],
+    ).fetchone()[0]
+    if not has_shards:
+        return
+
+    for alias, path in dbsession.execute(
+        f"select alias, path from {SHARDS_TABLE}"
+    ).fetchall():
+        dbsession.execute(
+            f"attach if not exists {quote_literal(path)} as {alias} (read_only)"
+        )
+
+
+def load_concurrently(
+    dbsession: duckdb.DuckDBPyConnection,
+    loaders: Dict[str, Callable[[duckdb.DuckDBPyConnection], None]],
+    max_workers: Optional[int] = None,
+):
+    """
+    Run loaders side by side in threads, each on its own cursor of `dbsession`, so they all
+    write into one database and nothing needs merging afterwards. DuckDB releases the GIL
+    while it works, so the loaders overlap. They must write distinct tables and attach any
+    other database under an alias of their own. Their stages record no bytes read, the
+    stage around the call has the total.
+
+    :param dbsession: Session on the run database.
+    :param loaders: Loader name to a function loading through the cursor it is given.
+    :param max_workers: Loaders running at once, all of them by default.
+    :raises: The error of the first failed loader, once every loader has finished.
+    """
+
+    def run(name: str, loader: Callable[[duckdb.DuckDBPyConnection], None]):
+        with dbsession.cursor() as cursor, shared_io():
+            loader(cursor)
+        log.info(f"Loader finished: {name}")
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(loaders)) as pool:
+        futures = [pool.submit(run, name, loader) for name, loader in loaders.items()]
+    for future in futures:
+        future.result()
+
+
+def merge_shard_databases(
+    dbsession: duckdb.DuckDBPyConnection,
+    shard_paths: Dict[str, str],
+    shard_tables: Dict[str, List[str]],
+    mode: str = DUCKDB_MERGE_MODE,
+):
+    """
+    Merge shard databases into the run database `dbsession` is connected to.
+
+    :param dbsession: Session on the run database.
+    :param shard_paths: Shard name to the path of its database file.
+    :param shard_tables: Shard name to the tables it holds.
+    :param mode: One of `MERGE_MODES`.
+    """
+    if mode not in MERGE_MODES:
+        raise ValueError(f"Unknown merge mode {mode}, expected one of {MERGE_MODES}")
+
+    if mode == "attach":
+        dbsession.execute(
+            f"create or replace table {SHARDS_TABLE} (alias varchar, path varchar)"
+        )
+
+    for shard_name, tables in shard_tables.items():
+        log.info(f"Merging shard: {shard_name}")
+        shard_path = shard_paths[shard_name]
+        if not os.path.exists(shard_path):
+            log.warning(f"Shard path does not exist: {shard_path}, skipping")
+            continue
+        shard_alias = _shard_alias(shard_name)
+
+        if mode == "copy":
+            dbsession.execute(
+                f"attach database {quote_literal(shard_path)} as {shard_alias}"
+            )
+            for t in tables:
+                _drop_relation(dbsession, t)
+                dbsession.execute(
+                    f"create table {t} as select * from {shard_alias}.{t}"
+                )
+            dbsession.execute(f"detach database {shard_alias}")
+            os.remove(shard_path)
+            log.info(f"Successfully merged {shard_alias} and removed {shard_path}")
+        else:
+            dbsession.execute(
+                f"attach if not exists {quote_literal(shard_path)} as {shard_alias} (read_only)"
+            )
+            for t in tables:
+                _drop_relation(dbsession, t)
+                dbsession.execute(f"create view {t} as select * from {shard_alias}.{t}")
+            dbsession.execute(
+                f"insert into {SHARDS_TABLE} values (?, ?)", [shard_alias, shard_path]
+            )
+            log.info(f"Successfully attached {shard_alias} from {shard_path}")
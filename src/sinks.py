@@ -0,0 +1,286 @@
+"""
+Where published tables end up. `BigQuerySink` stages and MERGEs into BigQuery; `LocalWarehouseSink`
+does the same into a DuckDB database on disk, from the same Parquet export, so the publish path
+runs and can be load-tested without cloud credentials.
+"""
+
+import abc
+import contextlib
+import functools
+import logging
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+import duckdb
+import pandas as pd
+from google.cloud import bigquery
+
+from src.bigquery import (
+    DATESET_ID,
+    PROJECT_ID,
+    StagedTable,
+    export_table,
+    publish_table_to_bigquery,
+    publish_tables_to_bigquery,
+    record_merged,
+    table_digest_path,
+    write_df_to_bigquery,
+)
+from src.enums import Table
+from src.ingestion import quote_identifier, quote_literal
+from src.instrumentation import track
+from src.locking import file_lock
+from src.sessions import connect_duckdb
+from src.settings import PUBLISH_SINK, PUBLISH_SINKS
+
+LOCAL_WAREHOUSE_PATH = os.getenv("LOCAL_WAREHOUSE_PATH", "warehouse.duckdb")
+GCP_CREDENTIALS_FILE = "gcp-credentials.json"
+
+# BigQuery column types of `Table.schema` as DuckDB types
+DUCKDB_COLUMN_TYPES = {
+    "STRING": "VARCHAR",
+    "INT64": "BIGINT",
+    "INTEGER": "BIGINT",
+    "FLOAT": "DOUBLE",
+    "FLOAT64": "DOUBLE",
+    "BOOL": "BOOLEAN",
+    "BOOLEAN": "BOOLEAN",
+    "TIMESTAMP": "TIMESTAMPTZ",
+    "DATE": "DATE",
+}
+
+log = logging.getLogger(__name__)
+
+
+class Sink(abc.ABC):
+    @abc.abstractmethod
+    def publish_table(
+        self,
+        dbsession: duckdb.DuckDBPyConnection,
+        table: Table,
+        work_dir: Optional[str] = None,
+        digest_dir: Optional[str] = None,
+    ) -> int:
+        """
+        Insert the rows of `table` missing from the sink, keyed on `table.unique_key_columns`.
+
+        :return: Number of rows staged.
+        """
+
+    @abc.abstractmethod
+    def publish_tables(
+        self,
+        dbsession: duckdb.DuckDBPyConnection,
+        tables: List[Table],
+        work_dir: Optional[str] = None,
+        digest_dir: Optional[str] = None,
+    ) -> Dict[Table, int]:
+        """
+        Publish several tables at once, either all of them or none.
+
+        :return: Number of rows staged per table.
+        """
+
+    @abc.abstractmethod
+    def write_df(self, df: pd.DataFrame, table: Table):
+        """
+        Append a DataFrame to `table` as is, without deduplication.
+        """
+
+
+class BigQuerySink(Sink):
+    def __init__(
+        self,
+        bigquery_client: bigquery.Client,
+        project_id: str = PROJECT_ID,
+        dataset_id: str = DATESET_ID,
+    ):
+        self.bigquery_client = bigquery_client
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+
+    def publish_table(self, dbsession, table, work_dir=None, digest_dir=None) -> int:
+        return publish_table_to_bigquery(
+            self.bigquery_client,
+            dbsession,
+            table,
+            self.project_id,
+            self.dataset_id,
+            work_dir=work_dir,
+            digest_dir=digest_dir,
+        )
+
+    def publish_tables(
+        self, dbsession, tables, work_dir=None, digest_dir=None
+    ) -> Dict[Table, int]:
+        return publish_tables_to_bigquery(
+            self.bigquery_client,
+            dbsession,
+            tables,
+            self.project_id,
+            self.dataset_id,
+            work_dir=work_dir,
+            digest_dir=digest_dir,
+        )
+
+    def write_df(self, df: pd.DataFrame, table: Table):
+        write_df_to_bigquery(
+            self.bigquery_client, df, table.schema, table.bigquery_table
+        )
+
+
+class LocalWarehouseSink(Sink):
+    """
+    A DuckDB database with one table per `Table`, created from its BigQuery schema.
+    Staged chunks are loaded into a staging table and MERGEd like in BigQuery; concurrent
+    publishers take turns on a lock next to the database.
+    """
+
+    alias = "warehouse"
+
+    def __init__(self, warehouse_path: str = LOCAL_WAREHOUSE_PATH):
+        self.warehouse_path = warehouse_path
+
+    @contextlib.contextmanager
+    def _attached(self, dbsession: duckdb.DuckDBPyConnection) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.warehouse_path) or ".", exist_ok=True)
+        with file_lock(f"{self.warehouse_path}.lock"):
+            dbsession.execute(
+                f"attach {quote_literal(self.warehouse_path)} as {self.alias} (read_only false)"
+            )
+            try:
+                yield
+            finally:
+                dbsession.execute(f"detach {self.alias}")
+
+    def _target(self, table: Table) -> str:
+        return f"{self.alias}.{quote_identifier(table.bigquery_table)}"
+
+    def _create_target(self, dbsession: duckdb.DuckDBPyConnection, table: Table):
+        columns = ", ".join(
+            f"{quote_identifier(f.name)} {DUCKDB_COLUMN_TYPES[f.field_type]}"
+            + (" not null" if f.mode == "REQUIRED" else "")
+            for f in table.schema
+        )
+        dbsession.execute(
+            f"create table if not exists {self._target(table)} ({columns})"
+        )
+
+    def _merge(self, dbsession: duckdb.DuckDBPyConnection, staged: StagedTable) -> int:
+        table = staged.table
+        staging = f"{self.alias}.{quote_identifier(f'{table.bigquery_table}_staging')}"
+        files = ", ".join(quote_literal(c) for c in staged.chunks)
+        columns = ", ".join(quote_identifier(c) for c in staged.columns)
+        on_clause = " and ".join(
+            f"T.{quote_identifier(k)} = S.{quote_identifier(k)}"
+            for k in table.unique_key_columns
+        )
+        self._create_target(dbsession, table)
+        dbsession.execute(
+            f"create or replace table {staging} as select {columns} from read_parquet([{files}])"
+        )
+        with track("local_merge", {"table": table.bigquery_table}) as metrics:
+            merged = dbsession.execute(f"""
+                merge into {self._target(table)} as T
+                using {staging} as S
+                on {on_clause}
+                when not matched then insert by name
+                """).fetchone()[0]
+            metrics.rows_in, metrics.rows_out = staged.rows, merged
+        dbsession.execute(f"drop table {staging}")
+        log.info(
+            f"MERGE inserted {merged} of {staged.rows} rows into {table.bigquery_table}"
+        )
+        return merged
+
+    def _finish(self, dbsession: duckdb.DuckDBPyConnection, staged: StagedTable):
+        record_merged(dbsession, staged)
+        shutil.rmtree(staged.work_dir, ignore_errors=True)
+
+    def publish_table(self, dbsession, table, work_dir=None, digest_dir=None) -> int:
+        return self.publish_tables(
+            dbsession, [table], work_dir=work_dir, digest_dir=digest_dir
+        )[table]
+
+    def publish_tables(
+        self, dbsession, tables, work_dir=None, digest_dir=None
+    ) -> Dict[Table, int]:
+        with contextlib.ExitStack() as stack:
+            if work_dir is None:
+                work_dir = stack.enter_context(
+                    tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+                )
+            staged_tables = []
+            for table in sorted(tables, key=lambda t: t.is_fact):
+                staged = export_table(
+                    dbsession,
+                    table,
+                    os.path.join(work_dir, table.name.lower()),
+                    table_digest_path(digest_dir, table),
+                )
+                if staged is not None:
+                    staged_tables.append(staged)
+
+            if staged_tables:
+                with self._attached(dbsession):
+                    dbsession.execute("begin transaction")
+                    try:
+                        for staged in staged_tables:
+                            self._merge(dbsession, staged)
+                        dbsession.execute("commit")
+                    except BaseException:
+                        dbsession.execute("rollback")
+                        raise
+                for staged in staged_tables:
+                    self._finish(dbsession, staged)
+
+        rows = {staged.table: staged.rows for staged in staged_tables}
+        return {table: rows.get(table, 0) for table in tables}
+
+    def write_df(self, df: pd.DataFrame, table: Table):
+        with (
+            connect_duckdb(task_class="publish") as dbsession,
+            self._attached(dbsession),
+        ):
+            self._create_target(dbsession, table)
+            dbsession.execute(
+                f"insert into {self._target(table)} by name select * from df"
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def get_bigquery_client(
+    credentials_file: str = GCP_CREDENTIALS_FILE, project_id: str = PROJECT_ID
+) -> bigquery.Client:
+    """
+    Client authenticated with the service account in `credentials_file`, built on first use
+    and shared by every later caller in the process.
+    """
+    from google.oauth2 import service_account
+
+    return bigquery.Client(
+        credentials=service_account.Credentials.from_service_account_file(
+            filename=credentials_file,
+            scopes=["https://www.googleapis.com/auth/cloud-platform"],
+        ),
+        project=project_id,
+    )
+
+
+def get_sink(
+    name: str = PUBLISH_SINK, warehouse_path: str = LOCAL_WAREHOUSE_PATH
+) -> Sink:
+    """
+    Build the sink selected by `name`, one of `PUBLISH_SINKS`. Only the BigQuery sink
+    reads credentials, and only when it is built.
+
+    :param name: One of `PUBLISH_SINKS`.
+    :param warehouse_path: Database the local sink MERGEs into.
+    """
+    if name == "bigquery":
+        return BigQuerySink(get_bigquery_client())
+    if name == "local":
+        return LocalWarehouseSink(warehouse_path)
+    raise ValueError(f"Unknown sink {name}, expected one of {PUBLISH_SINKS}")
@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional
+
+import duckdb
+from pendulum import Date
+
+from src.files import read_json, write_json
+from src.ingestion import quote_literal
+from src.locking import file_lock
+
+STATIC_CACHE_MAX_ENTRIES = int(os.getenv("STATIC_CACHE_MAX_ENTRIES", "7"))
+
+log = logging.getLogger(__name__)
+
+
+def _content_key(paths: List[str], tables: List[str], fingerprint: str) -> str:
+    # parsed tables depend on the engine and on what we derive from the files too,
+    # a DuckDB upgrade or a new derived table must not reuse old entries
+    digest = hashlib.sha256(duckdb.__version__.encode())
+    digest.update(",".join(tables).encode())
+    digest.update(fingerprint.encode())
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.file_digest(f, "sha256").digest())
+    return digest.hexdigest()
+
+
+def _evict(cache_dir: str, index: Dict[str, dict], max_entries: int):
+    # least recently used by feed date rather than wall clock, so a backfill
+    # over old days doesn't push out the entry the live runs keep hitting
+    by_last_feed = sorted(index, key=lambda k: index[k]["last_feed_date"])
+    for key in by_last_feed[: max(0, len(index) - max_entries)]:
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        del index[key]
+        log.info(f"Evicted {cache_dir} cache entry {key[:12]}")
+
+
+def load_with_cache(
+    dbsession: duckdb.DuckDBPyConnection,
+    cache_dir: Optional[str],
+    paths: List[str],
+    tables: List[str],
+    feed_date: Date,
+    load: Callable[[], None],
+    max_entries: int = STATIC_CACHE_MAX_ENTRIES,
+    fingerprint: str = "",
+):
+    """
+    Run `load`, or restore the tables it creates from a previous run on identical inputs.
+
+    Entries are keyed on the content hash of `paths` and hold the parsed `tables` as Parquet
+    under `cache_dir`. At most `max_entries` are kept, evicting the one whose latest feed date is oldest.
+
+    :param dbsession: Session the tables are loaded into.
+    :param cache_dir: Cache directory, caching is disabled when None.
+    :param paths: Input files `load` parses.
+    :param tables: Tables `load` creates.
+    :param feed_date: Date of the data being loaded, used for eviction.
+    :param load: Loads `tables` into `dbsession` from `paths`.
+    :param max_entries: Number of entries to keep.
+    :param fingerprint: Anything else the tables depend on, e.g. the SQL deriving them.
+    """
+    if cache_dir is None:
+        load()
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(os.path.join(cache_dir, "index.lock")):
+        key = _content_key(paths, tables, fingerprint)
+        entry_dir = os.path.join(cache_dir, key)
+        index = read_json(os.path.join(cache_dir, "index.json"), {})
+        start = time.perf_counter()
+
+        if key in index and os.path.isdir(entry_dir):
+            for t in tables:
+                parquet_path = os.path.join(entry_dir, f"{t}.parquet")
+                dbsession.execute(
+                    f"create or replace table {t} as select * from read_parquet({quote_literal(parquet_path)})"
+                )
+            entry = index[key]
+            entry["hits"] += 1
+            log.info(
+                f"Cache hit in {cache_dir} for {key[:12]}: restored {len(tables)} tables "
+                f"in {time.perf_counter() - start:.2f}s, parsing took {entry['load_seconds']:.2f}s"
+            )
+        else:
+            load()
+            load_seconds = time.perf_counter() - start
+            tmp_dir = f"{entry_dir}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for t in tables:
+                parquet_path = os.path.join(tmp_dir, f"{t}.parquet")
+                dbsession.execute(
+                    f"copy {t} to {quote_literal(parquet_path)} (format parquet, compression zstd)"
+                )
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            entry = {
+                "hits": 0,
+                "load_seconds": load_seconds,
+                "last_feed_date": feed_date.isoformat(),
+                "tables": tables,
+            }
+            log.info(
+                f"Cache miss in {cache_dir} for {key[:12]}: parsed {len(tables)} tables in {load_seconds:.2f}s"
+            )
+
+        entry["last_feed_date"] = max(entry["last_feed_date"], feed_date.isoformat())
+        index[key] = entry
+        _evict(cache_dir, index, max_entries)
+        write_json(os.path.join(cache_dir, "index.json"), index)
@@ -1,4 +1,13 @@
+import datetime
 import enum
+from typing import Dict, Optional
+
+import duckdb
+import pendulum
+
+from src.ingestion import quote_literal
+from src.instrumentation import instrumented_loader
+from src.locking import file_lock
 
 MONTH_MAP = {
     1: "January",
@@ -55,3 +64,90 @@ def get_time_of_day(hour: int) -> TimeOfDay:
         return TimeOfDay.EVENING
     else:
         return TimeOfDay.NIGHT
+
+
+def _case_sql(expression: str, labels: Dict[int, str]) -> str:
+    whens = " ".join(f"when {k} then '{v}'" for k, v in labels.items())
+    return f"case {expression} {whens} end"
+
+
+# labels come from the helpers above, so the SQL can't drift from them
+TIME_DIM_RANGE_QUERY = f"""
+select
+    cast(strftime(ts, '%Y%m%d%H') as bigint) as id,
+    timezone('UTC', ts) as full_timestamp,
+    hour(ts) as hour_,
+    {_case_sql("isodow(ts)", {d.value + 1: d.name for d in pendulum.WeekDay})} as weekday,
+    isodow(ts) as weekday_num,
+    {_case_sql("month(ts)", MONTH_MAP)} as month_,
+    month(ts) as month_num,
+    {_case_sql("month(ts)", {m: get_season(m).value for m in MONTH_MAP})} as season,
+    year(ts) as year_,
+    {_case_sql("hour(ts)", {h: get_time_of_day(h).value for h in range(24)})} as time_of_day,
+    isodow(ts) < 6 as is_business_day
+from generate_series(cast($start as timestamp), cast($end as timestamp), interval 1 hour) as hours(ts)
+"""
+
+
+@instrumented_loader("load_time_dim", ["time_dim"])
+def load_time_dim_into_duckdb(
+    start: pendulum.DateTime,
+    end: pendulum.DateTime,
+    dbsession: duckdb.DuckDBPyConnection,
+    calendar_path: Optional[str] = None,
+):
+    """
+    Load one TimeDim row per hour from `start` to `end` (inclusive, UTC) into the `time_dim` table.
+
+    With `calendar_path` the rows are looked up in a persistent calendar database instead,
+    which is filled a whole year at a time the first time a year is asked for.
+
+    :param start: First hour to load.
+    :param end: Last hour to load.
+    :param dbsession: Session to load the table into.
+    :param calendar_path: Persistent calendar database.
+    """
+    start, end = start.in_tz("UTC").naive(), end.in_tz("UTC").naive()
+    if calendar_path is None:
+        dbsession.execute(
+            f"create or replace table time_dim as {TIME_DIM_RANGE_QUERY}",
+            {"start": start, "end": end},
+        )
+        return
+
+    calendar_alias = "calendar"
+    with file_lock(f"{calendar_path}.lock"):
+        dbsession.execute(f"attach {quote_literal(calendar_path)} as {calendar_alias}")
+        try:
+            dbsession.execute(
+                f"""
+                create table if not exists {calendar_alias}.time_dim as
+                select * from ({TIME_DIM_RANGE_QUERY}) limit 0
+                """,
+                {"start": start, "end": end},
+            )
+            known_years = {
+                year
+                for (year,) in dbsession.execute(
+                    f"select distinct year_ from {calendar_alias}.time_dim"
+                ).fetchall()
+            }
+            for year in range(start.year, end.year + 1):
+                if year not in known_years:
+                    dbsession.execute(
+                        f"insert into {calendar_alias}.time_dim {TIME_DIM_RANGE_QUERY}",
+                        {
+                            "start": datetime.datetime(year, 1, 1),
+                            "end": datetime.datetime(year, 12, 31, 23),
+                        },
+                    )
+            dbsession.execute(
+                f"""
+                create or replace table time_dim as
+                select * from {calendar_alias}.time_dim
+                where full_timestamp between timezone('UTC', $start) and timezone('UTC', $end)
+                """,
+                {"start": start, "end": end},
+            )
+        finally:
+            dbsession.execute(f"detach {calendar_alias}")
@@ -1,16 +1,38 @@
+from typing import Optional
+
 import duckdb
-import pandas as pd
+import pendulum
+
+from src.ingestion import load_csv_into_duckdb
+from src.instrumentation import instrumented_loader
+from src.static_cache import load_with_cache
 
 VEHICLES_FILE_NAME = "ztm_vehicles_detailed.csv"
+VEHICLES_COLUMN_TYPES = {
+    "vehicle_number": "VARCHAR",
+    "carrier": "VARCHAR",
+    "manufacturer": "VARCHAR",
+    "type": "VARCHAR",
+    "production_year": "VARCHAR",
+}
+VEHICLES_KEY_COLUMNS = {"vehicle_key": "vehicle_number"}
 
 
+@instrumented_loader("load_vehicles", ["vehicles"])
 def load_vehicles_into_duckdb(
     dbsession: duckdb.DuckDBPyConnection,
+    cache_dir: Optional[str] = None,
+    as_of: Optional[pendulum.Date] = None,
 ):
-    df = pd.read_csv(f"data/{VEHICLES_FILE_NAME}")
-    tmp_view_name = "_tmp_vehicles"
-    dbsession.register(tmp_view_name, df)
-    dbsession.execute(
-        f"create or replace table vehicles as select * from {tmp_view_name}"
+    path = f"data/{VEHICLES_FILE_NAME}"
+    load_with_cache(
+        dbsession,
+        cache_dir,
+        [path],
+        ["vehicles"],
+        as_of or pendulum.today("UTC").date(),
+        lambda: load_csv_into_duckdb(
+            dbsession, "vehicles", [path], VEHICLES_COLUMN_TYPES, VEHICLES_KEY_COLUMNS
+        ),
+        fingerprint=f"{VEHICLES_COLUMN_TYPES}{VEHICLES_KEY_COLUMNS}",
     )
-    dbsession.unregister(tmp_view_name)
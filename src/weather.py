@@ -1,13 +1,44 @@
+import logging
 import os
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import duckdb
+import numpy as np
 import pandas as pd
 import pendulum
 
+from src.ingestion import configure_session, quote_literal, read_csv_sql
+from src.instrumentation import instrumented_loader
+from src.landing import land_files, read_landed_sql
+
 WEATHER_BUCKET = "weather"
+WEATHER_LOCAL_DIR = "data/weather"
+
+# synop stations around Warsaw as (lat, lon); IMGW files don't carry coordinates,
+# delays are matched to the nearest of these that has data for the day
+WEATHER_STATIONS: Dict[str, Tuple[float, float]] = {
+    "12375": (52.1628, 20.9611),  # Warszawa-Okęcie
+    "12360": (52.5883, 19.7256),  # Płock
+    "12385": (52.1808, 22.2464),  # Siedlce
+    "12280": (53.1044, 20.3600),  # Mława
+}
+WEATHER_COLUMN_TYPES = {
+    "id_stacji": "VARCHAR",
+    "data_pomiaru": "VARCHAR",
+    "godzina_pomiaru": "INTEGER",
+    "temperatura": "DOUBLE",
+    "suma_opadu": "DOUBLE",
+    "predkosc_wiatru": "DOUBLE",
+    "kierunek_wiatru": "DOUBLE",
+    "wilgotnosc_wzgledna": "DOUBLE",
+    "cisnienie": "DOUBLE",
+}
+
+log = logging.getLogger(__name__)
 
 
+# row-wise reference implementations, the pipeline uses the vectorised versions below;
+# tests/test_weather.py and benchmarks/weather.py check they agree over a grid of bucket edges
 def _classify_fall_type(temperature: float) -> str:
     return "snow" if temperature < 2.0 else "rain"
 
@@ -48,6 +79,46 @@ def _classify_general_circumstances(
         return "opera-level-atrocious"
 
 
+def _classify_fall_types(temperature: pd.Series) -> np.ndarray:
+    return np.where(temperature < 2.0, "snow", "rain")
+
+
+def _score_general_circumstances(
+    temp: pd.Series, wind: pd.Series, humidity: pd.Series, precip: pd.Series
+) -> np.ndarray:
+    # comparisons against NaN are false, so missing values score 0 like in the row-wise version
+    return (
+        np.select(
+            [
+                (10 <= temp) & (temp <= 25),
+                (2 <= temp) & (temp < 10),
+                (temp < 2) | (temp > 35),
+            ],
+            [2, 1, -1],
+            0,
+        )
+        + np.select([wind < 5, wind < 10, wind > 15], [2, 1, -1], 0)
+        + np.select([humidity < 70, humidity > 90], [1, -1], 0)
+        + np.select([precip == 0, precip > 5], [2, -1], 0)
+    )
+
+
+def _classify_general_circumstances_vectorized(
+    temp: pd.Series, wind: pd.Series, humidity: pd.Series, precip: pd.Series
+) -> np.ndarray:
+    score = _score_general_circumstances(temp, wind, humidity, precip)
+    return np.select(
+        [score >= 6, score >= 4, score >= 2, score >= 0],
+        [
+            "ludicrously-divine",
+            "titanically-passable",
+            "nobly-sufficient",
+            "courageously-subpar",
+        ],
+        "opera-level-atrocious",
+    )
+
+
 def _apply_weather_transformations(df: pd.DataFrame) -> pd.DataFrame:
     # Rename columns to match the query's output
     df = df.rename(
@@ -81,28 +152,29 @@ def _apply_weather_transformations(df: pd.DataFrame) -> pd.DataFrame:
     df["humidity_percent"] = df["humidity_percent"].astype(float)
     df["pressure_hpa"] = df["pressure_hpa"].astype(float)
 
+    # measurement hours are UTC, same as the hour delays are truncated to
+    df["measured_at"] = pd.to_datetime(df["measurement_date"]).dt.tz_localize(
+        "UTC"
+    ) + pd.to_timedelta(df["hour"].astype(int), unit="h")
+
     # Filter out rows with missing temperature or wind speed
     df = df[df["temperature"].notnull() & df["wind_speed_mps"].notnull()]
 
-    # Drop duplicates as in the original logic
-    df = df.drop_duplicates(subset=["station_id", "hour"])
+    # Keep one measurement per station and hour, every station has its own series
+    df = df.drop_duplicates(subset=["station_id", "measurement_date", "hour"])
 
     # Continue with business logic transformations
-    print(f"✅ Merged {len(df):,} weather records")
-    print("🔄 Applying business transformations...")
+    log.info(f"Merged {len(df):,} weather records, applying business transformations")
 
     df["fall_mm"] = df["precipitation_mm"].fillna(0).round().astype(int)
-    df["fall_type"] = df["temperature"].apply(_classify_fall_type)
+    df["fall_type"] = _classify_fall_types(df["temperature"])
     df["wind_speed_mps"] = df["wind_speed_mps"].fillna(0).round().astype(int)
     df["pressure_hpa"] = df["pressure_hpa"].fillna(1013).round().astype(int)
-    df["general_circumstances"] = df.apply(
-        lambda row: _classify_general_circumstances(
-            row["temperature"],
-            row["wind_speed_mps"],
-            row["humidity_percent"],
-            row["fall_mm"],
-        ),
-        axis=1,
+    df["general_circumstances"] = _classify_general_circumstances_vectorized(
+        df["temperature"],
+        df["wind_speed_mps"],
+        df["humidity_percent"],
+        df["fall_mm"],
     )
 
     final_df = df[
@@ -116,37 +188,66 @@ def _apply_weather_transformations(df: pd.DataFrame) -> pd.DataFrame:
             "humidity_percent",
             "pressure_hpa",
             "general_circumstances",
+            "station_id",
+            "measured_at",
         ]
     ]
     return final_df
 
 
+def weather_blob_prefix(as_of: pendulum.Date) -> str:
+    return f"{as_of.year}/{as_of.month:02d}/{as_of.day:02d}/"
+
+
 def _get_weather_files_for_day(
     as_of: pendulum.Date,
 ) -> List[str]:
-    prefix = f"{as_of.year}/{as_of.month:02d}/{as_of.day:02d}/"
-    files = [f for f in os.listdir(f"data/weather/{prefix}/") if f.endswith(".csv")]
-    return [os.path.join(f"data/weather/{prefix}/", f) for f in files]
+    day_dir = f"{WEATHER_LOCAL_DIR}/{weather_blob_prefix(as_of)}"
+    files = [f for f in os.listdir(day_dir) if f.endswith(".csv")]
+    return [os.path.join(day_dir, f) for f in files]
 
 
 def _merge_weather_files(
     as_of: pendulum.Date,
+    dbsession: duckdb.DuckDBPyConnection,
+    landing_dir: Optional[str] = None,
 ) -> pd.DataFrame:
     files = _get_weather_files_for_day(as_of)
-    dfs = [pd.read_csv(f) for f in files]
-    if not dfs:
+    if not files:
         return pd.DataFrame()
-    merged_df = pd.concat(dfs, ignore_index=True)
-    if "hour" in merged_df.columns:
-        merged_df = merged_df.drop_duplicates(subset=["hour"])
-    return merged_df
+
+    if landing_dir is not None:
+        # the day's station files are landed together, any change re-lands the day
+        dataset_dir = f"{landing_dir}/weather"
+        land_files(
+            dbsession,
+            dataset_dir,
+            {as_of.isoformat(): files},
+            lambda batch: f"""
+            select *, {quote_literal(as_of.isoformat())} as day
+            from {read_csv_sql(batch, WEATHER_COLUMN_TYPES, sniff=False)}
+            """,
+            ["day"],
+        )
+        return dbsession.execute(
+            f"select * exclude (day) from {read_landed_sql(dataset_dir)} where day = ?",
+            [as_of],
+        ).df()
+    # one small file per station, DuckDB reads them in parallel;
+    # they all share the IMGW layout, so sniffing each one is wasted time
+    configure_session(dbsession)
+    return dbsession.execute(
+        f"select * from {read_csv_sql(files, WEATHER_COLUMN_TYPES, sniff=False)}"
+    ).df()
 
 
+@instrumented_loader("load_weather", ["weather", "weather_stations"])
 def load_weather_into_duckdb(
     as_of: pendulum.Date,
     dbsession: duckdb.DuckDBPyConnection,
+    landing_dir: Optional[str] = None,
 ):
-    merged_df = _merge_weather_files(as_of)
+    merged_df = _merge_weather_files(as_of, dbsession, landing_dir)
     df = _apply_weather_transformations(merged_df)
     temp_view_name = "_tmp_weather"
     dbsession.register(temp_view_name, df)
@@ -154,3 +255,20 @@ def load_weather_into_duckdb(
         f"create or replace table weather as select * from {temp_view_name}"
     )
     dbsession.unregister(temp_view_name)
+
+    station_ids = set(df["station_id"].astype(str)) if len(df) else set()
+    unknown = sorted(station_ids - WEATHER_STATIONS.keys())
+    if unknown:
+        log.warning(
+            f"No coordinates for {len(unknown)} weather stations, skipping them: {unknown[:10]}"
+        )
+    dbsession.execute(
+        "create or replace table weather_stations (station_id varchar, lat double, lon double)"
+    )
+    dbsession.executemany(
+        "insert into weather_stations values (?, ?, ?)",
+        [
+            [s, *WEATHER_STATIONS[s]]
+            for s in sorted(station_ids & WEATHER_STATIONS.keys())
+        ],
+    )
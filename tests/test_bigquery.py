@@ -0,0 +1,53 @@
+import datetime
+
+from benchmarks.fakes import FakeBigQueryClient
+from src import bigquery as publish
+from src.files import read_json, write_json
+
+
+def _write_chunks(tmp_path, count):
+    chunks = []
+    for i in range(count):
+        chunk = tmp_path / f"chunk_{i}.parquet"
+        chunk.write_bytes(b"rows")
+        chunks.append(str(chunk))
+    return chunks, [f"project.dataset.staging_{i}" for i in range(count)]
+
+
+def test_retry_skips_loaded_chunks(tmp_path):
+    chunks, staging_table_ids = _write_chunks(tmp_path, 3)
+    checkpoint_path = str(tmp_path / "loaded_chunks.json")
+    publish._stage_chunks(
+        FakeBigQueryClient(), chunks, staging_table_ids, checkpoint_path
+    )
+
+    retry = FakeBigQueryClient()
+    publish._stage_chunks(retry, chunks, staging_table_ids, checkpoint_path)
+    assert retry.loads == []
+
+
+def test_retry_reloads_chunks_whose_staging_tables_may_have_expired(tmp_path):
+    chunks, staging_table_ids = _write_chunks(tmp_path, 3)
+    checkpoint_path = str(tmp_path / "loaded_chunks.json")
+    publish._stage_chunks(
+        FakeBigQueryClient(), chunks, staging_table_ids, checkpoint_path
+    )
+    loaded = read_json(checkpoint_path)
+    old = (
+        datetime.datetime.now(datetime.timezone.utc) - publish.STAGING_TABLE_EXPIRATION
+    )
+    write_json(checkpoint_path, {**loaded, "chunk_0.parquet": old.isoformat()})
+
+    retry = FakeBigQueryClient()
+    publish._stage_chunks(retry, chunks, staging_table_ids, checkpoint_path)
+    assert [load["destination"] for load in retry.loads] == [staging_table_ids[0]]
+
+
+def test_checkpoint_without_load_times_loads_everything_again(tmp_path):
+    chunks, staging_table_ids = _write_chunks(tmp_path, 2)
+    checkpoint_path = str(tmp_path / "loaded_chunks.json")
+    write_json(checkpoint_path, ["chunk_0.parquet", "chunk_1.parquet"])
+
+    retry = FakeBigQueryClient()
+    publish._stage_chunks(retry, chunks, staging_table_ids, checkpoint_path)
+    assert len(retry.loads) == 2
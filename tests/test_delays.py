@@ -0,0 +1,117 @@
+import os
+
+import duckdb
+import pendulum
+import pytest
+
+from src.delays import (
+    _delays_day_dir,
+    _normalize_delay,
+    _normalize_timestamp,
+    _normalized_delays_sql,
+    load_delays_into_duckdb,
+)
+
+TIMESTAMPS = [
+    "2024-12-25 10:15:00",
+    "2024-12-25T10:59:59",
+    "2024-12-25T10:15:00Z",
+    "2024-12-25T23:59:59Z",
+    "2024-12-25T10:15:00+01:00",
+    "2024-12-25T00:15:00+0100",
+    "2024-12-25T10:15:00-05",
+    "2024-12-25T10:30:00-0530",
+    "2024-12-25T10:15:00+05:30",
+    "2024-12-25T10:45:00+05:45",
+    "2024-12-25T10:59:59.999",
+    "2024-12-25T10:15:00.123456+02:00",
+    "2024-12-25T10:59:59.999999Z",
+]
+DELAYS = [
+    "0 min",
+    "5 min",
+    "12 min",
+    "1 min przed czasem",
+    "3 min przed czasem",
+    "-2 min",
+]
+
+
+@pytest.fixture
+def delays_csv(tmp_path):
+    path = tmp_path / "delays.csv"
+    rows = [
+        f"{timestamp},{i},{i},Stop,{delay}"
+        for i, (timestamp, delay) in enumerate(
+            (t, d) for t in TIMESTAMPS for d in DELAYS
+        )
+    ]
+    path.write_text("\n".join(["Timestamp,Route,Vehicle No,Stop Name,Delay", *rows]))
+    return str(path)
+
+
+def _normalized(path):
+    with duckdb.connect() as dbsession:
+        dbsession.execute("set TimeZone = 'UTC'")
+        return dbsession.execute(
+            f'select "Timestamp", "Delay" from ({_normalized_delays_sql([path])}) order by cast("Route" as integer)'
+        ).fetchall()
+
+
+def test_normalized_delays_match_reference(delays_csv):
+    expected = [
+        (_normalize_timestamp(t), _normalize_delay(d))
+        for t in TIMESTAMPS
+        for d in DELAYS
+    ]
+    for (timestamp, delay), (expected_timestamp, expected_delay) in zip(
+        _normalized(delays_csv), expected, strict=True
+    ):
+        assert timestamp == expected_timestamp
+        assert delay == expected_delay
+
+
+def test_failed_incremental_load_raises_its_own_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    as_of = pendulum.date(2024, 12, 25)
+    day_dir = _delays_day_dir(as_of)
+    os.makedirs(day_dir)
+    header = "Timestamp,Route,Vehicle No,Stop Name,Delay"
+    with open(f"{day_dir}/10.csv", "w") as f:
+        f.write(f"{header}\n2024-12-25 10:00:00,1,1,Stop,5 min\n")
+    with duckdb.connect() as dbsession:
+        load_delays_into_duckdb(as_of, dbsession, state_path="state.duckdb")
+
+    with open(f"{day_dir}/11.csv", "w") as f:
+        f.write(f"{header}\n2024-12-25 11:00:00,1,2,Stop,abc\n")
+    with duckdb.connect() as dbsession, pytest.raises(duckdb.ConversionException):
+        load_delays_into_duckdb(as_of, dbsession, state_path="state.duckdb")
+
+    # the state is left as the last successful load wrote it
+    with duckdb.connect("state.duckdb") as dbsession:
+        assert dbsession.execute("select count(*) from delays").fetchone() == (1,)
+        assert dbsession.execute("select count(*) from manifest").fetchone() == (1,)
+
+
+def test_state_of_another_duckdb_version_is_parsed_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    as_of = pendulum.date(2024, 12, 25)
+    day_dir = _delays_day_dir(as_of)
+    os.makedirs(day_dir)
+    with open(f"{day_dir}/10.csv", "w") as f:
+        f.write("Timestamp,Route,Vehicle No,Stop Name,Delay\n")
+        f.write("2024-12-25 10:00:00,1,1,Stop,5 min\n")
+    with duckdb.connect() as dbsession:
+        load_delays_into_duckdb(as_of, dbsession, state_path="state.duckdb")
+        expected = dbsession.execute("select vehicle_key from delays").fetchall()
+
+    # keys as another version's hash() might have computed them
+    with duckdb.connect("state.duckdb") as dbsession:
+        dbsession.execute("update delays set vehicle_key = vehicle_key + 1")
+        dbsession.execute("update fingerprint set fingerprint = 'other'")
+
+    with duckdb.connect() as dbsession:
+        load_delays_into_duckdb(as_of, dbsession, state_path="state.duckdb")
+        assert (
+            dbsession.execute("select vehicle_key from delays").fetchall() == expected
+        )
@@ -0,0 +1,30 @@
+import duckdb
+
+from src.ingestion import quote_literal
+from src.landing import land_files, read_landed_sql
+
+
+def _land(dbsession, dataset_dir, path, fingerprint):
+    return land_files(
+        dbsession,
+        dataset_dir,
+        {path: [path]},
+        lambda files: f"select *, 1 as part from read_csv({quote_literal(files[0])})",
+        ["part"],
+        fingerprint=fingerprint,
+    )
+
+
+def test_batches_land_again_when_the_fingerprint_changes(tmp_path):
+    path = str(tmp_path / "raw.csv")
+    with open(path, "w") as f:
+        f.write("a\n1\n2\n")
+    dataset_dir = str(tmp_path / "landed")
+    with duckdb.connect() as dbsession:
+        assert _land(dbsession, dataset_dir, path, "duckdb 1") == 1
+        assert _land(dbsession, dataset_dir, path, "duckdb 1") == 0
+        assert _land(dbsession, dataset_dir, path, "duckdb 2") == 1
+        # the batch replaced what it landed before
+        assert dbsession.execute(
+            f"select count(*) from {read_landed_sql(dataset_dir)}"
+        ).fetchone() == (2,)
@@ -0,0 +1,56 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from src.weather import (
+    _classify_fall_type,
+    _classify_fall_types,
+    _classify_general_circumstances,
+    _classify_general_circumstances_vectorized,
+)
+
+# values on and around every bucket edge of the classifiers, plus missing readings
+TEMPERATURES = [
+    -30.0,
+    1.9,
+    2.0,
+    2.1,
+    9.9,
+    10.0,
+    17.0,
+    25.0,
+    25.1,
+    35.0,
+    35.1,
+    45.0,
+    np.nan,
+]
+WIND_SPEEDS = [0.0, 4.9, 5.0, 9.9, 10.0, 15.0, 15.1, 40.0, np.nan]
+HUMIDITIES = [0.0, 69.9, 70.0, 90.0, 90.1, 100.0, np.nan]
+PRECIPITATION = [0.0, 0.1, 5.0, 5.1, 50.0, np.nan]
+
+
+def _grid() -> pd.DataFrame:
+    return pd.DataFrame(
+        itertools.product(TEMPERATURES, WIND_SPEEDS, HUMIDITIES, PRECIPITATION),
+        columns=["temperature", "wind_speed_mps", "humidity_percent", "fall_mm"],
+    )
+
+
+def test_fall_types_match_rowwise():
+    df = _grid()
+    expected = [_classify_fall_type(t) for t in df["temperature"]]
+    assert _classify_fall_types(df["temperature"]).tolist() == expected
+
+
+def test_general_circumstances_match_rowwise():
+    df = _grid()
+    columns = [
+        df["temperature"],
+        df["wind_speed_mps"],
+        df["humidity_percent"],
+        df["fall_mm"],
+    ]
+    expected = [_classify_general_circumstances(*row) for row in zip(*columns)]
+    assert _classify_general_circumstances_vectorized(*columns).tolist() == expected